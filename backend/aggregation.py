@@ -0,0 +1,163 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+STATUS_COLUMNS = ["Connectivity", "Update", "Alerts", "Security"]
+SCORE_COLUMNS = ["ConnectivityScore", "UpdateScore", "AlertScore", "SecurityScore"]
+
+# RankLabel cut-offs of SiteHealthScore: <0.5 -> 3, <0.7 -> 2, <0.85 -> 1, else 0
+LABEL_THRESHOLDS = np.array([0.5, 0.7, 0.85])
+
+# -----------------------------
+# Columnar resource table
+# -----------------------------
+@dataclass
+class ResourceTable:
+    """Flattened resources with SiteName, ResourceType and statuses as integer category codes.
+
+    `*_names` hold the sorted categories, `*_codes` index into them (one entry per resource).
+    """
+    site_names: np.ndarray
+    site_codes: np.ndarray
+    resource_names: np.ndarray
+    type_names: np.ndarray
+    type_codes: np.ndarray
+    status_names: dict
+    status_codes: dict
+
+    def __len__(self):
+        return len(self.site_codes)
+
+    def to_frame(self, rows=None):
+        """Row-per-resource DataFrame (optionally restricted to `rows`)"""
+        rows = slice(None) if rows is None else rows
+        df = pd.DataFrame({
+            "SiteName": self.site_names[self.site_codes[rows]],
+            "ResourceName": self.resource_names[rows],
+            "ResourceType": self.type_names[self.type_codes[rows]],
+        })
+        for col in STATUS_COLUMNS:
+            df[col] = self.status_names[col][self.status_codes[col][rows]]
+        return df
+
+def flatten_sites(sites):
+    """Flatten the nested sites JSON into a ResourceTable in a single pass"""
+    site_names, resource_names, types = [], [], []
+    statuses = {col: [] for col in STATUS_COLUMNS}
+    for site in sites:
+        site_name = site.get("SiteName")
+        for resource in site.get("Resources", []):
+            site_names.append(site_name)
+            resource_names.append(resource["ResourceName"])
+            types.append(resource["ResourceType"])
+            for col in STATUS_COLUMNS:
+                statuses[col].append(resource[col]["status"])
+
+    site_codes, site_categories = pd.factorize(np.array(site_names, dtype=object), sort=True)
+    type_codes, type_categories = pd.factorize(np.array(types, dtype=object), sort=True)
+    status_codes, status_names = {}, {}
+    for col in STATUS_COLUMNS:
+        codes, categories = pd.factorize(np.array(statuses[col], dtype=object), sort=True)
+        status_codes[col] = codes.astype(np.int32)
+        status_names[col] = np.asarray(categories, dtype=object)
+    return ResourceTable(
+        site_names=np.asarray(site_categories, dtype=object),
+        site_codes=site_codes.astype(np.int32),
+        resource_names=np.array(resource_names, dtype=object),
+        type_names=np.asarray(type_categories, dtype=object),
+        type_codes=type_codes.astype(np.int32),
+        status_names=status_names,
+        status_codes=status_codes,
+    )
+
+# -----------------------------
+# Per-site aggregation
+# -----------------------------
+@dataclass
+class SiteAggregate:
+    """Per-site features of a ResourceTable, one row per entry of `table.site_names`"""
+    table: ResourceTable
+    scores: np.ndarray
+    health: np.ndarray
+    labels: np.ndarray
+    modes: dict
+    type_matrix: np.ndarray
+
+    def __len__(self):
+        return len(self.health)
+
+    def mode(self, col, i):
+        return self.table.status_names[col][self.modes[col][i]]
+
+    def to_frame(self):
+        """Site-level DataFrame: SiteName, score means, SiteHealthScore, RankLabel and Type_* flags"""
+        df = pd.DataFrame(self.scores, columns=SCORE_COLUMNS)
+        df.insert(0, "SiteName", self.table.site_names)
+        df["SiteHealthScore"] = self.health
+        df["RankLabel"] = self.labels
+        types = pd.DataFrame(self.type_matrix, columns=[f"Type_{t}" for t in self.table.type_names])
+        return pd.concat([df, types], axis=1)
+
+    def feature_matrix(self, feature_names):
+        """Float matrix of the requested site features (score means or Type_* flags), missing ones as 0"""
+        columns = dict(zip(SCORE_COLUMNS, self.scores.T))
+        columns.update(zip((f"Type_{t}" for t in self.table.type_names), self.type_matrix.T))
+        X = np.zeros((len(self), len(feature_names)))
+        for j, name in enumerate(feature_names):
+            if name in columns:
+                X[:, j] = columns[name]
+        return X
+
+def site_cohorts(agg):
+    """Cohort of every site: its resource type mix, e.g. "microsoft.hybridcompute/machines+microsoft.kubernetes/connectedclusters".
+
+    Sites of one cohort have comparable feature vectors, which makes them the query
+    groups for learning-to-rank and the unit of per-group rankings in the API.
+    """
+    if len(agg) == 0:
+        return np.empty(0, dtype=object)
+    patterns, inverse = np.unique(agg.type_matrix, axis=0, return_inverse=True)
+    names = ["+".join(agg.table.type_names[np.flatnonzero(pattern)]) for pattern in patterns]
+    return np.asarray(names, dtype=object)[inverse.ravel()]
+
+def health_to_labels(health):
+    """RankLabel of each health score (3 = worst), see LABEL_THRESHOLDS"""
+    return 3 - np.searchsorted(LABEL_THRESHOLDS, health, side="right")
+
+def aggregate_sites(table, score_maps):
+    """Per-site score means, health, rank label, status modes and multi-hot resource types.
+
+    Everything is computed from the integer codes with bincount/scatter passes, so the
+    cost is linear in the number of resources. Status modes break ties towards the
+    alphabetically first status, like `Series.mode()[0]`.
+    """
+    n_sites = len(table.site_names)
+    counts = np.bincount(table.site_codes, minlength=n_sites)
+    denom = np.maximum(counts, 1)
+
+    # One tally of (site, status) pairs per column gives both the mode and the score sum
+    # (count x score per status, which accumulates less rounding error than a running sum)
+    scores, modes = [], {}
+    for col in STATUS_COLUMNS:
+        names = table.status_names[col]
+        k = len(names)
+        tally = np.bincount(table.site_codes.astype(np.int64) * k + table.status_codes[col], minlength=n_sites * k)
+        tally = tally.reshape(n_sites, k)
+        lut = np.array([score_maps[col].get(value, 0) for value in names], dtype=float)
+        scores.append(tally @ lut / denom)
+        modes[col] = tally.argmax(axis=1) if k else np.zeros(n_sites, dtype=int)
+    scores = np.column_stack(scores)
+    health = scores.sum(axis=1) / len(STATUS_COLUMNS)
+
+    type_matrix = np.zeros((n_sites, len(table.type_names)), dtype=np.uint8)
+    type_matrix[table.site_codes, table.type_codes] = 1
+
+    return SiteAggregate(
+        table=table,
+        scores=scores,
+        health=health,
+        labels=health_to_labels(health),
+        modes=modes,
+        type_matrix=type_matrix,
+    )
@@ -1,12 +1,38 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 import json
-import pandas as pd
-import joblib
-import random
+import os
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import threading
+import time
+import numpy as np
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from aggregation import aggregate_sites, flatten_sites, site_cohorts
+from catalog import rule_based_recommendations_batch, score_maps
+from coalesce import SingleFlight
+from exporter import ExportWriter, atomic_write
+from metrics import collect_request_timings, metrics, request_timings, server_timing_header
+from model_bundle import load_models, MANIFEST
+from reloader import FileWatcher
+from resource_store import META as TABLE_META, SiteResources, load_table, save_table, table_exists
+from site_index import SORT_KEYS, SiteIndex
+from snapshot_store import SnapshotStore
+from telemetry_store import TelemetryLog, UpdatedResources, apply_deltas, apply_deltas_to_sites
+from recommender import (
+    apply_fallback, build_recommendation_table, lookup_recommendations, predict_model_recommendations
+)
 
 app = FastAPI(title="SiteSightAI Backend")
+logger = logging.getLogger("uvicorn.error")  # shows up in the server log
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,219 +42,803 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -----------------------------
+# Metrics
+# -----------------------------
+# Stage timings, cache hit ratios and request latencies served at GET /metrics (SITESIGHT_METRICS=0 disables them)
+metrics.enabled = os.environ.get("SITESIGHT_METRICS", "1") != "0"
+# Also report each response's stage timings in a Server-Timing header
+SERVER_TIMING = os.environ.get("SITESIGHT_SERVER_TIMING") == "1"
+request_count = metrics.counter(
+    "sitesight_requests_total", "HTTP requests by method, route and status", ["method", "route", "status"]
+)
+request_latency = metrics.histogram(
+    "sitesight_request_duration_seconds", "HTTP request latency until the response starts", ["method", "route"]
+)
+reload_count = metrics.counter("sitesight_reloads_total", "Snapshot reloads by result", ["result"])
+
 # -----------------------------
 # Load trained models
 # -----------------------------
-rec_model = joblib.load("rec_model.pkl")
-mlb = joblib.load("mlb.pkl")
-rec_features = list(joblib.load("rec_features.pkl"))
-ranker = joblib.load("ranker.pkl")
-rank_features = list(joblib.load("rank_features.pkl"))
+MODEL_BUNDLE_PATH = os.environ.get("SITESIGHT_MODEL_BUNDLE", "model_bundle")
+# Compiled NumPy tree predictors: "auto" (compiled forest, native ranker), "all" or "none"
+MODEL_COMPILED = os.environ.get("SITESIGHT_COMPILED_MODELS", "auto")
 
 # -----------------------------
 # Load sites JSON
 # -----------------------------
-with open("data/sites_clean.json") as f:
-    sites = json.load(f)
-
-# -----------------------------
-# Weights and mappings
-# -----------------------------
-weights = {"Connectivity": 0.3, "Update": 0.3, "Alerts": 0.2, "Security": 0.2}
-connectivity_map = {"Connected": 1, "NeedsAttention": 0.5, "NotRecentlyConnected": 0.6}
-update_map = {"UptoDate": 1, "UpdateAvailable": 0.5, "NeedsAttention": 0.5, "Unknown": 0, "UpdateInProgress": 0.5}
-alert_map = {"NoAlerts": 1, "NeedsAttention": 0.5}
-security_map = {"Compliant": 1, "NonCompliant": 0.5}
-
-# -----------------------------
-# Predefined recommendations (fallback)
-# -----------------------------
-recommendations = {
-    "Connectivity": [
-        "Check site network/firewall", "Verify DNS resolution", "Inspect router/switch logs",
-        "Check ISP/service provider status", "Run ping and traceroute diagnostics", "Test bandwidth and latency",
-        "Validate VPN or private link tunnels", "Check DHCP/Static IP configuration", "Review load balancer health",
-        "Examine physical cabling/ports", "Monitor packet loss and jitter", "Audit QoS or traffic shaping policies",
-        "Verify SSL/TLS handshake for secure connections", "Confirm routing table consistency",
-        "Check wireless interference (if Wi-Fi dependent)"
-    ],
-    "Update": [
-        "Check for recent update availability", "Verify if update download failed", "Check permissions for update installation",
-        "Confirm device has sufficient disk space", "Validate system date/time (NTP sync)", "Review update installation logs",
-        "Restart services post-update if required", "Ensure rollback/recovery points are set",
-        "Check dependency patches or prerequisites", "Cross-check update version compatibility",
-        "Audit devices with pending reboots", "Review group policy or WSUS configurations",
-        "Check update throttling or bandwidth caps", "Ensure security patches applied before deadlines",
-        "Test update in staging before full rollout"
-    ],
-    "Alerts": [
-        "Review alert logs for recurring issues", "Classify alerts by severity", "Escalate high-priority alerts",
-        "Set alert suppression for false positives", "Define auto-remediation playbooks", "Tag alerts with responsible owners",
-        "Check alert thresholds and fine-tune", "Validate alert integration with ticketing system",
-        "Review alert correlation across systems", "Verify escalation paths for after-hours",
-        "Archive and report historical alerts", "Perform RCA (Root Cause Analysis) on repeated alerts",
-        "Ensure monitoring agents are healthy", "Simulate incident scenarios for alert validation",
-        "Audit alert notifications (email/SMS/webhook)"
-    ],
-    "Security": [
-        "Check patch compliance", "Validate access control policies", "Run vulnerability scan",
-        "Verify antivirus/EDR signatures updated", "Confirm encryption at rest and in transit",
-        "Audit expired or weak TLS certificates", "Check multi-factor authentication enforcement",
-        "Review firewall/NSG rules", "Audit privileged account usage", "Ensure least privilege principle applied",
-        "Check endpoint hardening (disable unused ports)", "Run penetration test in staging environment",
-        "Review SIEM dashboards for anomalies", "Verify data backup encryption",
-        "Check compliance with GDPR/ISO/NIST/PCI standards"
-    ]
-}
-
-# -----------------------------
-# Helper functions
-# -----------------------------
-def calculate_resource_score(resource):
-    return (
-        connectivity_map.get(resource["Connectivity"]["status"], 0) * weights["Connectivity"] +
-        update_map.get(resource["Update"]["status"], 0) * weights["Update"] +
-        alert_map.get(resource["Alerts"]["status"], 0) * weights["Alerts"] +
-        security_map.get(resource["Security"]["status"], 0) * weights["Security"]
-    )
+DATA_PATH = "data/sites_clean.json"
+# Columnar copy of the telemetry (see resource_store.py); used instead of the JSON when present
+DATA_TABLE_PATH = os.environ.get("SITESIGHT_DATA_TABLE", "data/sites_table")
 
-def flatten_sites_json(sites):
-    flattened_data = []
-    for site in sites:
-        site_name = site.get("SiteName")
-        for resource in site.get("Resources", []):
-            connectivity_score = connectivity_map.get(resource["Connectivity"]["status"], 0)
-            update_score = update_map.get(resource["Update"]["status"], 0)
-            alert_score = alert_map.get(resource["Alerts"]["status"], 0)
-            security_score = security_map.get(resource["Security"]["status"], 0)
-            resource_score = calculate_resource_score(resource)
-
-            flattened_data.append({
+def load_sites_versioned():
+    """Read and validate the sites JSON, returning (sites, data version = content hash)"""
+    with open(DATA_PATH, "rb") as f:
+        raw = f.read()
+    sites = json.loads(raw)
+    if not isinstance(sites, list) or not all(isinstance(site, dict) and "SiteName" in site for site in sites):
+        raise ValueError(f"{DATA_PATH} is not a list of sites")
+    return sites, hashlib.sha1(raw).hexdigest()[:16]
+
+# -----------------------------
+# Telemetry ingestion log
+# -----------------------------
+# Deltas ingested via POST /telemetry since the last compaction into DATA_PATH, one log per
+# server process (data/telemetry.log.<pid>)
+TELEMETRY_LOG_PATH = "data/telemetry.log"
+# Compact the logs into DATA_PATH once they hold this many deltas
+TELEMETRY_COMPACT_AFTER = int(os.environ.get("SITESIGHT_COMPACT_AFTER", "10000"))
+telemetry_log = TelemetryLog(TELEMETRY_LOG_PATH, fsync=os.environ.get("SITESIGHT_TELEMETRY_FSYNC") == "1")
+
+def load_telemetry():
+    """Telemetry plus a replay of the ingestion logs of all server processes, returning
+    ({SiteName: [resource]}, data version).
+
+    The columnar table is memory-mapped and served through a lazy SiteResources view;
+    otherwise the sites JSON is parsed and grouped.
+    """
+    # Another process's compaction can't move deltas from the logs into the stored telemetry meanwhile
+    with telemetry_log.locked():
+        if table_exists(DATA_TABLE_PATH):
+            table, data_version = load_table(DATA_TABLE_PATH)
+            grouped = SiteResources(table)
+        else:
+            sites, data_version = load_sites_versioned()
+            grouped = group_sites_by_name(sites)
+        delta_batches = telemetry_log.replay()
+    for deltas in delta_batches:
+        grouped = UpdatedResources(grouped, apply_deltas(grouped, deltas))
+    if delta_batches:
+        data_version = f"{data_version}+{telemetry_log.count}"
+    return grouped, data_version
+
+def save_telemetry(delta_batches):
+    """Apply logged delta batches to the stored telemetry and write it back in the format it is
+    read from, returning the new data version. Sites keep their stored order and records."""
+    if table_exists(DATA_TABLE_PATH):
+        table, _ = load_table(DATA_TABLE_PATH)
+        sites = [{"SiteName": name, "Resources": resources} for name, resources in SiteResources(table).items()]
+        return save_table(flatten_sites(apply_deltas_to_sites(sites, delta_batches)), DATA_TABLE_PATH)
+    with open(DATA_PATH, "rb") as f:
+        sites = orjson.loads(f.read())
+    body = orjson.dumps(apply_deltas_to_sites(sites, delta_batches))
+    atomic_write(DATA_PATH, body)
+    return hashlib.sha1(body).hexdigest()[:16]
+
+# -----------------------------
+# Recommendations
+# -----------------------------
+# Scoring weights, status maps and the rule-based fallback are shared with training (see catalog.py)
+def load_rec_table(models):
+    """Model output per status combination, precomputed by train_recommendation.py when available"""
+    table = models.rec_table
+    if table is None:
+        status_values = {col: list(score_map) for col, score_map in score_maps.items()}
+        table = build_recommendation_table(models.rec_model, models.mlb, models.rec_features, status_values)
+    # Own copy, live predictions for unseen statuses are memoized into it
+    return dict(table)
+
+def predict_recommendations_ml_batch(df, models, rec_table):
+    """Recommendations for all resource rows of `df` from the status-combination table"""
+    def predict_live(rows):
+        # The forest is only loaded for statuses missing from rec_table
+        return predict_model_recommendations(rows, models.rec_model, models.mlb, models.rec_features)
+
+    stats = {}
+    recs = lookup_recommendations(df, rec_table, live_predict=predict_live, stats=stats)
+    metrics.cache("rec_table", hits=stats["hits"], misses=stats["misses"])
+    return apply_fallback(df, recs, rule_based_recommendations_batch)
+
+# -----------------------------
+# Ranking
+# -----------------------------
+def rank_site_entries(sites, models):
+    """Rank the given sites (without recommendations), returning {SiteName: ranked site record}.
+
+    A record holds the response `entry` plus the unrounded SiteHealthScore, RankScore,
+    RankLabel and the site's ResourceTypes used by the site index.
+    """
+    with metrics.span("flatten"):
+        table = flatten_sites(sites)
+    return rank_table(table, models)
+
+def rank_table(table, models):
+    """rank_site_entries for telemetry already flattened into a ResourceTable"""
+    if len(table) == 0:
+        return {}
+
+    # Aggregate per site: score means, health, status modes and resource type flags
+    with metrics.span("aggregate"):
+        agg = aggregate_sites(table, score_maps)
+        cohorts = site_cohorts(agg)
+
+    # 🔹 Use the exact rank_features from training, predict with LambdaMART model
+    with metrics.span("rank_predict"):
+        rank_scores = models.ranker.predict(agg.feature_matrix(models.rank_features))
+
+    with metrics.span("rank_records"):
+        return site_records(table, agg, cohorts, rank_scores)
+
+def site_records(table, agg, cohorts, rank_scores):
+    """Ranked site records (see rank_site_entries) from the aggregated table and the ranker's scores"""
+    records = {}
+    for i, site_name in enumerate(table.site_names):
+        connectivity, update, alerts, security = agg.scores[i]
+        health_scores = {
+            "Connectivity": round(float(connectivity), 2),
+            "Update": round(float(update), 2),
+            "Alerts": round(float(alerts), 2),
+            "Security": round(float(security), 2)
+        }
+
+        records[site_name] = {
+            "entry": {
                 "SiteName": site_name,
-                "ResourceName": resource["ResourceName"],
-                "ResourceType": resource["ResourceType"],
-                "Connectivity": resource["Connectivity"]["status"],
-                "Update": resource["Update"]["status"],
-                "Alerts": resource["Alerts"]["status"],
-                "Security": resource["Security"]["status"],
-                "ConnectivityScore": connectivity_score,
-                "UpdateScore": update_score,
-                "AlertScore": alert_score,
-                "SecurityScore": security_score,
-                "ResourceHealthScore": round(resource_score, 2)
-            })
-    return pd.DataFrame(flattened_data)
-
-def map_health_to_label(score):
-    if score < 0.5:
-        return 3
-    elif score < 0.7:
-        return 2
-    elif score < 0.85:
-        return 1
-    else:
-        return 0
-
-def rule_based_recommendations(resource):
-    recs = []
-    if resource["Connectivity"] in ["NotRecentlyConnected", "NeedsAttention"]:
-        recs.append(random.choice(recommendations["Connectivity"]))
-    if resource["Update"] in ["NeedsAttention", "UpdateInProgress", "UpdateAvailable"]:
-        recs.append(random.choice(recommendations["Update"]))
-    if resource["Alerts"] == "NeedsAttention":
-        recs.append(random.choice(recommendations["Alerts"]))
-    if resource["Security"] == "NonCompliant":
-        recs.append(random.choice(recommendations["Security"]))
-    if not recs:
-        recs.append("No action required")
-    return recs[:3]
-
-def predict_recommendations_ml(resource):
-    """Use trained RandomForest model to predict recommendations, fallback to rule-based if empty"""
-    features = pd.DataFrame([{
-        "Connectivity": resource["Connectivity"],
-        "Update": resource["Update"],
-        "Alerts": resource["Alerts"],
-        "Security": resource["Security"]
-    }])
-    features = pd.get_dummies(features).reindex(columns=rec_features, fill_value=0)
-
-    pred = rec_model.predict(features)
-    recs = mlb.inverse_transform(pred)
-
-    if not recs or not recs[0]:
-        return rule_based_recommendations(resource.to_dict())
-    return recs[0]
-
-# -----------------------------
-# Endpoint
+                "RankScore": round(float(rank_scores[i]), 4),
+                "SiteHealthScore": round(float(agg.health[i]), 2),
+                "HealthSignals": health_scores,
+                "Connectivity": agg.mode("Connectivity", i),
+                "Update": agg.mode("Update", i),
+                "Alerts": agg.mode("Alerts", i),
+                "Security": agg.mode("Security", i)
+            },
+            "SiteHealthScore": float(agg.health[i]),
+            "RankScore": float(rank_scores[i]),
+            "RankLabel": int(agg.labels[i]),
+            "ResourceTypes": list(table.type_names[np.flatnonzero(agg.type_matrix[i])]),
+            # Resource type cohort, the query group the ranker was trained on
+            "Group": cohorts[i]
+        }
+    return records
+
+def recommend_sites(sites, models, rec_table):
+    """Per-resource recommendations of the given sites, returning {SiteName: {ResourceName: recs}}"""
+    with metrics.span("flatten"):
+        table = flatten_sites(sites)
+        df = table.to_frame()
+    # Predict recommendations for all resources at once
+    with metrics.span("recommend_predict"):
+        resource_recs = predict_recommendations_ml_batch(df, models, rec_table)
+
+    recs_per_site = {}
+    with metrics.span("recommend_group"):
+        for j in range(len(table)):
+            site_name = table.site_names[table.site_codes[j]]
+            recs_per_site.setdefault(site_name, {})[table.resource_names[j]] = [f"{r}" for r in resource_recs[j]]
+    return recs_per_site
+
+def rank_grouped(grouped, models):
+    """rank_site_entries of {SiteName: [resource]}, straight from the columns when it is table-backed"""
+    if isinstance(grouped, SiteResources):
+        return rank_table(grouped.table, models)
+    return rank_site_entries([{"SiteName": name, "Resources": resources} for name, resources in grouped.items()], models)
+
+def group_sites_by_name(sites):
+    """Merge site records sharing a SiteName, like the groupby in rank_site_entries does.
+    Sites without resources never make it into the ranking and are dropped."""
+    grouped = {}
+    for site in sites:
+        if site.get("Resources"):
+            grouped.setdefault(site.get("SiteName"), []).extend(site["Resources"])
+    return grouped
+
+def site_fingerprint(resources):
+    return hashlib.sha1(json.dumps(resources, sort_keys=True).encode()).hexdigest()
+
+def resource_fingerprints(grouped):
+    """{SiteName: fingerprint} of all sites, hashed from the columns when table-backed"""
+    if isinstance(grouped, UpdatedResources):
+        fingerprints = resource_fingerprints(grouped.base)
+        for name, resources in grouped.updates.items():
+            fingerprints.pop(name, None)
+            if resources:
+                fingerprints[name] = site_fingerprint(resources)
+        return fingerprints
+    if isinstance(grouped, SiteResources):
+        return grouped.fingerprints()
+    return {name: site_fingerprint(resources) for name, resources in grouped.items()}
+
+# Sites per streamed chunk; each chunk's recommendations are computed right before it is sent
+STREAM_CHUNK_SITES = 500
+
+# The ranked_sites.json exports are opt-in and written by a background thread, off the request path.
+# SITESIGHT_EXPORT_COMPRESS lists precompressed variants ("gzip,br"), SITESIGHT_EXPORT_INDENT=1 indents.
+EXPORT_RANKED_JSON = os.environ.get("SITESIGHT_EXPORT_JSON") == "1"
+exporter = ExportWriter(
+    ["ranked_sites.json", "../frontend/public/ranked_sites.json"],
+    compress=[c for c in os.environ.get("SITESIGHT_EXPORT_COMPRESS", "").split(",") if c],
+    indent=os.environ.get("SITESIGHT_EXPORT_INDENT") == "1"
+)
+
+# -----------------------------
+# CPU workers and shared snapshots
+# -----------------------------
+# Worker processes computing the full response's recommendations in parallel; 0 computes them in-process
+CPU_WORKERS = int(os.environ.get("SITESIGHT_CPU_WORKERS", "0"))
+# Fewer missing sites than this are computed in-process, not worth the round trip to the workers
+CPU_POOL_MIN_SITES = 2 * STREAM_CHUNK_SITES
+# Directory through which the server's worker processes (uvicorn --workers N) share the ranked
+# records and full response of each version, so only one of them computes them
+SNAPSHOT_DIR = os.environ.get("SITESIGHT_SNAPSHOT_DIR")
+snapshot_store = SnapshotStore(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
+
+cpu_pool = None
+cpu_pool_lock = threading.Lock()
+# In a CPU worker process: the (models, rec_table) it last loaded
+worker_models = None
+
+def get_cpu_pool():
+    """The CPU worker pool, started on first use; None when disabled"""
+    global cpu_pool
+    with cpu_pool_lock:
+        if cpu_pool is None and CPU_WORKERS > 0:
+            # spawn: workers import this module afresh rather than inheriting the server's threads and locks
+            cpu_pool = ProcessPoolExecutor(CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return cpu_pool
+
+def discard_cpu_pool(pool):
+    """Shut down a broken pool (e.g. a worker was killed), so get_cpu_pool() starts a new one"""
+    global cpu_pool
+    with cpu_pool_lock:
+        if cpu_pool is pool:
+            cpu_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def recommend_in_worker(model_version, sites):
+    """recommend_sites in a CPU worker process, with the worker's own copy of the models.
+    Returns None when the bundle on disk is no longer `model_version`."""
+    global worker_models
+    if worker_models is None or worker_models[0].version != model_version:
+        models = load_models(MODEL_BUNDLE_PATH, compiled=MODEL_COMPILED, allow_legacy=model_version == "legacy")
+        if models.version != model_version:
+            return None
+        worker_models = (models, load_rec_table(models))
+    return recommend_sites(sites, *worker_models)
+
+class RankingSnapshot:
+    """Ranked sites of one telemetry version scored with one model bundle, served from memory.
+
+    A snapshot is never re-ranked in place: a reload builds a new snapshot with
+    `updated()` and swaps it in, so requests keep a consistent view (read-copy-update).
+    Each site's ranking only depends on that site's own resources, so a data reload
+    only re-ranks the sites whose resources changed; the rest are reused.
+    Recommendations are computed lazily, per site for detail requests or all at
+    once when the full ranked response is first requested. With a snapshot store,
+    full rankings and full responses are shared with the other server processes.
+    """
+
+    def __init__(self, models, rec_table, grouped, data_version, previous=None, changed=None):
+        """`grouped` is the telemetry as {SiteName: [resource]}. When `changed` (site names)
+        is given, only those sites are compared against `previous`."""
+        # Guards `recommendations`; only held to read and merge, never while computing
+        self.lock = threading.Lock()
+        # Serializes builds of the full response, so it is built once
+        self.payload_lock = threading.Lock()
+        self.models = models
+        self.rec_table = rec_table
+        self.data_version = data_version
+        self.payload = None
+        self.grouped = grouped
+        self._fingerprints = None
+
+        if previous is None or previous.models is not models:
+            # Everything is ranked, unless another server process already did
+            self.changed = len(grouped)
+            key = self.shared_key()
+            if key is not None:
+                stored, found = snapshot_store.get_or_build(key, "records", lambda: orjson.dumps(rank_grouped(grouped, models)))
+                metrics.cache("snapshot_store", hits=int(found), misses=int(not found))
+                with stored:
+                    records = orjson.loads(stored[:])
+                if found:
+                    self.changed = 0
+            else:
+                records = rank_grouped(grouped, models)
+            self.recommendations = {}
+            with metrics.span("site_index"):
+                self.index = SiteIndex(records)
+            return
+
+        if changed is None:
+            with metrics.span("fingerprints"):
+                changed = {
+                    name for name, fp in self.fingerprints.items() if previous.fingerprints.get(name) != fp
+                }
+                changed.update(name for name in previous.index.records if name not in grouped)
+        reranked = [name for name in changed if name in grouped]
+        self.changed = len(reranked)
+        # Sites whose ranking carries over from the previous snapshot count as hits
+        metrics.cache("site_rankings", hits=len(grouped) - self.changed, misses=self.changed)
+
+        # Changed entries are overwritten rather than removed where possible (None marks stale
+        # recommendations): copying a dict that had keys removed is several times slower
+        records = dict(previous.index.records)
+        for name in changed:
+            if name not in grouped:
+                records.pop(name, None)
+        records.update(rank_site_entries(
+            [{"SiteName": name, "Resources": grouped[name]} for name in reranked], models
+        ))
+        with previous.lock:
+            self.recommendations = dict(previous.recommendations)
+        for name in changed:
+            if name in self.recommendations:
+                self.recommendations[name] = None
+        with metrics.span("site_index"):
+            self.index = previous.index.updated(records, changed)
+
+    def shared_key(self):
+        """Key of this snapshot in the snapshot store, or None when it isn't shared. Versions with
+        ingested telemetry ("+N") only exist in the process that received it, and legacy model
+        files have no version to tell them apart."""
+        if snapshot_store is None or "+" in self.data_version or self.models.version == "legacy":
+            return None
+        return snapshot_store.key(self.data_version, self.models.version)
+
+    @property
+    def fingerprints(self):
+        """{SiteName: fingerprint of its resources}, only computed once a later snapshot diffs against it"""
+        if self._fingerprints is None:
+            self._fingerprints = resource_fingerprints(self.grouped)
+        return self._fingerprints
+
+    def updated(self, grouped=None, data_version=None, models=None, rec_table=None):
+        """New snapshot with new telemetry and/or models, reusing whatever is unchanged"""
+        if models is None:
+            models, rec_table = self.models, self.rec_table
+        if grouped is None:
+            grouped, data_version = self.grouped, self.data_version
+        return RankingSnapshot(models, rec_table, grouped, data_version, previous=self)
+
+    def with_site_updates(self, updates, data_version):
+        """New snapshot where only the sites in `updates` ({SiteName: [resource]}) changed.
+        Costs copies of the per-site dicts and index arrays, no pass over the fleet in Python."""
+        grouped = UpdatedResources(self.grouped, updates)
+        return RankingSnapshot(
+            self.models, self.rec_table, grouped, data_version, previous=self, changed=set(updates)
+        )
+
+    def recommendations_for(self, names, cache=True):
+        """Recommendations of the given sites, computing the missing ones together (and caching
+        them, unless `cache` is false). They are computed outside the lock, so concurrent
+        requests for other sites don't wait."""
+        with self.lock:
+            found = {name: self.recommendations.get(name) for name in names}
+        missing = [name for name, recs in found.items() if recs is None and name in self.grouped]
+        metrics.cache("site_recommendations", hits=len(names) - len(missing), misses=len(missing))
+        if missing:
+            computed = recommend_sites(
+                [{"SiteName": name, "Resources": self.grouped[name]} for name in missing],
+                self.models, self.rec_table
+            )
+            if cache:
+                with self.lock:
+                    self.recommendations.update(computed)
+            found.update(computed)
+        return {name: found[name] or {} for name in names}
+
+    def iter_ranked_chunks(self, chunk_size=STREAM_CHUNK_SITES, cache=True):
+        """Yield the full ranked entries with recommendations, `chunk_size` sites at a time,
+        computing each chunk's recommendations only when it is reached. Streamed responses
+        pass cache=False, so their memory stays one chunk instead of growing with the fleet."""
+        index = self.index
+        # 🔹 Sort by SiteHealthScore ascending (smallest first)
+        names, _ = index.query(max(len(index), 1), sort="health")
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            recs = self.recommendations_for(chunk, cache=cache)
+            yield [{**index.records[name]["entry"], "Recommendations": recs[name]} for name in chunk]
+
+    def recommend_in_pool(self, names):
+        """Compute the missing recommendations of `names` in the CPU workers, in parallel chunks.
+        Chunks a worker couldn't do are left missing for recommendations_for."""
+        with self.lock:
+            missing = [name for name in names if self.recommendations.get(name) is None and name in self.grouped]
+        if len(missing) < CPU_POOL_MIN_SITES:
+            return
+        size = max(STREAM_CHUNK_SITES, -(-len(missing) // (CPU_WORKERS * 4)))
+        pool = get_cpu_pool()
+        with metrics.span("recommend_pool"):
+            futures, broken = [], False
+            try:
+                for start in range(0, len(missing), size):
+                    futures.append(pool.submit(
+                        recommend_in_worker, self.models.version,
+                        [{"SiteName": name, "Resources": self.grouped[name]} for name in missing[start:start + size]]
+                    ))
+            except BrokenProcessPool:
+                broken = True
+            for future in futures:
+                try:
+                    recs = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    continue
+                except Exception:
+                    logger.exception("CPU worker failed, computing its recommendations in-process")
+                    continue
+                if recs is not None:
+                    with self.lock:
+                        self.recommendations.update(recs)
+            if broken:
+                logger.error("CPU worker pool is broken (a worker died), restarting it and computing in-process")
+                discard_cpu_pool(pool)
+
+    def build_payload(self):
+        """Body of the full ranked response with recommendations"""
+        if CPU_WORKERS > 0:
+            self.recommend_in_pool(list(self.index.records))
+        response = [entry for chunk in self.iter_ranked_chunks() for entry in chunk]
+        with metrics.span("serialize"):
+            return orjson.dumps(response)
+
+    def full_payload(self):
+        """(body, etag) of the full ranked response with recommendations, built on first use
+        (or memory-mapped from the snapshot store when another process built it)"""
+        with self.payload_lock:
+            metrics.cache("full_payload", hits=int(self.payload is not None), misses=int(self.payload is None))
+            if self.payload is None:
+                key = self.shared_key()
+                if key is not None:
+                    stored, found = snapshot_store.get_or_build(key, "payload", self.build_payload)
+                    metrics.cache("snapshot_store", hits=int(found), misses=int(not found))
+                    body = memoryview(stored)
+                else:
+                    body = self.build_payload()
+                self.payload = (body, '"%s"' % hashlib.sha1(body).hexdigest())
+            return self.payload
+
+def export_ranked_sites(served):
+    """Queue a (debounced) background export of the given snapshot's full ranking"""
+    if EXPORT_RANKED_JSON:
+        exporter.schedule(lambda: served.full_payload()[0])
+
+def stream_ndjson(chunks):
+    for chunk in chunks:
+        yield b"".join(orjson.dumps(entry) + b"\n" for entry in chunk)
+
+def stream_json_array(chunks):
+    separator = b"["
+    for chunk in chunks:
+        if chunk:
+            yield separator + b",".join(orjson.dumps(entry) for entry in chunk)
+            separator = b","
+    yield b"]" if separator == b"," else b"[]"
+
+# -----------------------------
+# Serving state and hot reload
+# -----------------------------
+# The snapshot being served. Only ever replaced as a whole (under reload_lock), so a
+# request that read it once sees one consistent data/model version throughout.
+snapshot = None
+reload_lock = threading.Lock()
+
+# Seconds between checks of the data file and model bundle manifest, 0 disables watching
+RELOAD_INTERVAL = float(os.environ.get("SITESIGHT_RELOAD_INTERVAL", "5"))
+# POST /admin/reload requires this token in X-Admin-Token and is disabled without one
+ADMIN_TOKEN = os.environ.get("SITESIGHT_ADMIN_TOKEN")
+# POST /telemetry requires this token in X-Ingest-Token and is disabled without one
+INGEST_TOKEN = os.environ.get("SITESIGHT_INGEST_TOKEN")
+
+def check_token(given, expected, setting):
+    """404 while the endpoint is disabled (no `setting` token configured), 403 for a wrong token"""
+    if not expected:
+        raise HTTPException(status_code=404, detail=f"This endpoint is disabled ({setting} is not set)")
+    if not hmac.compare_digest(given or "", expected):
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+def current_snapshot():
+    """The snapshot to serve from, building the first one on first use"""
+    if snapshot is None:
+        reload(initial=True)
+    return snapshot
+
+def reload(data=True, model=True, initial=False):
+    """Load new telemetry and/or models (when their version changed) and swap in a new snapshot.
+
+    Everything is loaded and validated before the swap; on failure the current
+    snapshot keeps being served and the error is raised. With `initial`, only
+    builds the first snapshot if there is none yet. Returns what changed.
+    """
+    global snapshot
+    try:
+        with reload_lock:
+            served = snapshot
+            if initial and served is not None:
+                return None
+            new_models = rec_table = grouped = data_version = None
+            if served is None or model:
+                with metrics.span("load_models"):
+                    # Once a bundle is served, a missing one is an error rather than a switch to the legacy files
+                    allow_legacy = served is None or served.models.version == "legacy"
+                    models = load_models(MODEL_BUNDLE_PATH, compiled=MODEL_COMPILED, allow_legacy=allow_legacy)
+                    if served is None or models.version != served.models.version:
+                        new_models, rec_table = models.validate(), load_rec_table(models)
+            if served is None or data:
+                with metrics.span("load_telemetry"):
+                    grouped, data_version = load_telemetry()
+                if served is not None and data_version == served.data_version:
+                    grouped = data_version = None
+
+            if served is None:
+                with metrics.span("build_snapshot"):
+                    served = RankingSnapshot(new_models, rec_table, grouped, data_version)
+            elif new_models is not None or grouped is not None:
+                with metrics.span("build_snapshot"):
+                    served = served.updated(grouped, data_version, models=new_models, rec_table=rec_table)
+            else:
+                reload_count.inc("unchanged")
+                return {"reloaded": False, "data_version": served.data_version, "model_version": served.models.version}
+            snapshot = served
+    except Exception:
+        reload_count.inc("failed")
+        raise
+
+    reload_count.inc("reloaded")
+    logger.info(
+        "Serving data %s with models %s (%d sites re-ranked)",
+        served.data_version, served.models.version, served.changed
+    )
+    export_ranked_sites(served)
+    return {
+        "reloaded": True,
+        "data_version": served.data_version,
+        "model_version": served.models.version,
+        "sites_reranked": served.changed
+    }
+
+def ingest_telemetry(deltas):
+    """Apply resource status deltas: log them, then swap in a snapshot with only the affected
+    sites re-ranked. Returns the new snapshot and the affected site names."""
+    global snapshot
+    current_snapshot()
+    with reload_lock:
+        served = snapshot
+        updates = apply_deltas(served.grouped, deltas)
+        with metrics.span("telemetry_append"):
+            telemetry_log.append(deltas)
+        data_version = served.data_version.split("+")[0] + f"+{telemetry_log.count}"
+        served = snapshot = served.with_site_updates(updates, data_version)
+    if telemetry_log.count >= TELEMETRY_COMPACT_AFTER:
+        threading.Thread(target=compact_telemetry, name="telemetry-compaction", daemon=True).start()
+    export_ranked_sites(served)
+    return served, list(updates)
+
+def compact_telemetry():
+    """Fold the ingestion logs of all server processes into the stored telemetry, so restarts
+    and reloads don't replay them, then reload it. The reload also brings in the deltas the
+    other processes ingested; they reload once their watcher sees the stored telemetry change."""
+    with reload_lock:
+        if snapshot is None or telemetry_log.count == 0:
+            return
+        with metrics.span("telemetry_compaction"):
+            data_version = telemetry_log.compact(save_telemetry)
+    if data_version is not None:
+        logger.info("Compacted the telemetry logs (data %s)", data_version)
+    reload(model=False)
+
+DATA_FILES = [DATA_PATH, os.path.join(DATA_TABLE_PATH, TABLE_META)]
+
+def reload_changed(paths):
+    reload(data=any(path in DATA_FILES for path in paths), model=any(path not in DATA_FILES for path in paths))
+
+watcher = FileWatcher(DATA_FILES + [os.path.join(MODEL_BUNDLE_PATH, MANIFEST)], reload_changed, interval=RELOAD_INTERVAL)
+
+# Read from the served snapshot when /metrics is scraped
+metrics.gauge("sitesight_sites", "Ranked sites being served", collect=lambda: {(): len(snapshot.index)} if snapshot else {})
+metrics.gauge(
+    "sitesight_telemetry_log_deltas", "Ingested deltas not yet compacted into the stored telemetry",
+    collect=lambda: {(): telemetry_log.count}
+)
+metrics.gauge(
+    "sitesight_model_load_seconds", "Load time of each model bundle part (parts load on first use)", ["part"],
+    collect=lambda: {(part,): seconds for part, seconds in snapshot.models.load_times.items()} if snapshot else {}
+)
+
+@app.on_event("startup")
+def start_up():
+    """Load and validate the models and build the first snapshot before serving, reporting the timings"""
+    start = time.perf_counter()
+    current_snapshot()
+    logger.info(
+        "Startup in %.0f ms: models %s (%s), %d sites",
+        (time.perf_counter() - start) * 1000, snapshot.models.version,
+        snapshot.models.timing_report(), len(snapshot.index)
+    )
+    if CPU_WORKERS > 0:
+        # Start the workers and load their models now rather than on the first full response
+        for _ in range(CPU_WORKERS):
+            get_cpu_pool().submit(recommend_in_worker, snapshot.models.version, [])
+    watcher.start()
+    if EXPORT_RANKED_JSON:
+        exporter.start()
+
+@app.on_event("shutdown")
+def shut_down():
+    watcher.stop()
+    exporter.stop(flush=EXPORT_RANKED_JSON)
+    if cpu_pool is not None:
+        cpu_pool.shutdown(cancel_futures=True)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count and time requests, reporting their stage timings in a Server-Timing header when enabled"""
+    if not (metrics.enabled or SERVER_TIMING):
+        return await call_next(request)
+    timings, token = collect_request_timings() if SERVER_TIMING else (None, None)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if token is not None:
+            request_timings.reset(token)
+    elapsed = time.perf_counter() - start
+    # The route template, so /sites/{site_name} is one series rather than one per site
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    request_count.inc(request.method, route, str(response.status_code))
+    request_latency.observe(elapsed, request.method, route)
+    if SERVER_TIMING:
+        # Stages that run while a streamed body is sent come after the headers and are not included
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+@app.middleware("http")
+async def add_version_headers(request: Request, call_next):
+    """Report the data and model versions a response was computed from"""
+    response = await call_next(request)
+    served = getattr(request.state, "snapshot", None)
+    if served is not None:
+        response.headers["X-Data-Version"] = served.data_version
+        response.headers["X-Model-Version"] = served.models.version
+    return response
+
+def serve(request):
+    """The current snapshot, remembered on the request for the version headers"""
+    request.state.snapshot = current_snapshot()
+    return request.state.snapshot
+
 # -----------------------------
+# Endpoints
+# -----------------------------
+# Concurrent requests for a snapshot's full response wait for one computation of it
+payload_flights = SingleFlight()
+
 @app.get("/")
-def ranked_sites():
-    df = flatten_sites_json(sites)
-
-    # Aggregate per site
-    site_df = df.groupby("SiteName").agg({
-        "ConnectivityScore": "mean",
-        "UpdateScore": "mean",
-        "AlertScore": "mean",
-        "SecurityScore": "mean",
-        "ResourceType": lambda x: list(x)
-    }).reset_index()
-
-    # Compute site-level health score
-    site_df["SiteHealthScore"] = site_df[
-        ["ConnectivityScore", "UpdateScore", "AlertScore", "SecurityScore"]
-    ].mean(axis=1)
-    site_df["RankLabel"] = site_df["SiteHealthScore"].apply(map_health_to_label)
-
-    # One-hot encode resource types
-    all_types = sorted(set([rtype for sublist in site_df["ResourceType"] for rtype in sublist]))
-    for t in all_types:
-        site_df[f"Type_{t}"] = site_df["ResourceType"].apply(lambda x: 1 if t in x else 0)
-
-     # 🔹 Use the exact rank_features.pkl from training
-    X_rank = site_df.reindex(columns=rank_features, fill_value=0)
-
-    # Predict ranking scores with LambdaMART model
-    site_df["RankScore"] = ranker.predict(X_rank)
-
-    # 🔹 Sort by SiteHealthScore ascending (smallest first)
-    ranked_df = site_df.sort_values(by="SiteHealthScore", ascending=True)
-
-    response = []
-    for _, row in ranked_df.iterrows():
-        health_scores = {
-            "Connectivity": round(row["ConnectivityScore"], 2),
-            "Update": round(row["UpdateScore"], 2),
-            "Alerts": round(row["AlertScore"], 2),
-            "Security": round(row["SecurityScore"], 2)
+async def ranked_sites(request: Request, fmt: str = Query("json", alias="format", pattern="^(json|ndjson|json-stream)$")):
+    served = serve(request) if snapshot is not None else await run_in_threadpool(serve, request)
+    if fmt == "ndjson":
+        return StreamingResponse(stream_ndjson(served.iter_ranked_chunks(cache=False)), media_type="application/x-ndjson")
+    if fmt == "json-stream":
+        return StreamingResponse(stream_json_array(served.iter_ranked_chunks(cache=False)), media_type="application/json")
+    # Computed off the event loop; the waiting requests don't hold threadpool threads
+    body, etag = served.payload or await payload_flights.run(served, lambda: run_in_threadpool(served.full_payload))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/sites")
+def list_sites(
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    min_label: int = Query(None, ge=0, le=3),
+    resource_type: str = None,
+    group: str = None,
+    sort: str = Query("health", pattern="^(" + "|".join(SORT_KEYS) + ")$")
+):
+    """Ranked site summaries (without recommendations), filtered and paginated.
+    With `group` and sort=-rankscore this is the ranking within one cohort."""
+    index = serve(request).index
+    records = index.records
+    names, total = index.query(
+        limit, offset, min_label=min_label, resource_type=resource_type, group=group, sort=sort
+    )
+    return {
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "sort": sort,
+        "items": [
+            {**records[name]["entry"], "RankLabel": records[name]["RankLabel"], "Group": records[name]["Group"]}
+            for name in names
+        ]
+    }
+
+@app.get("/groups")
+def list_groups(request: Request):
+    """The site cohorts (ranking groups) with their number of sites, largest first"""
+    index = serve(request).index
+    groups = sorted(index.by_group.items(), key=lambda item: (-len(item[1]), item[0]))
+    return [{"Group": group, "Sites": len(rows)} for group, rows in groups]
+
+@app.get("/sites/{site_name}")
+def site_detail(request: Request, site_name: str):
+    """One ranked site with per-resource recommendations, computed on demand"""
+    served = serve(request)
+    record = served.index.records.get(site_name)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown site {site_name}")
+    return {
+        **record["entry"],
+        "RankLabel": record["RankLabel"],
+        "Group": record["Group"],
+        "Recommendations": served.recommendations_for([site_name])[site_name]
+    }
+
+def status_type(col):
+    """The statuses of `col` the models score (catalog.score_maps); others are rejected with a 422"""
+    return Literal[tuple(score_maps[col])]
+
+class ResourceDelta(BaseModel):
+    SiteName: str
+    ResourceName: str
+    # ResourceType and all four statuses are required for resources not seen before
+    ResourceType: Optional[str] = None
+    Connectivity: Optional[status_type("Connectivity")] = None
+    Update: Optional[status_type("Update")] = None
+    Alerts: Optional[status_type("Alerts")] = None
+    Security: Optional[status_type("Security")] = None
+
+@app.post("/telemetry")
+def post_telemetry(request: Request, deltas: List[ResourceDelta], x_ingest_token: str = Header(None)):
+    """Ingest a batch of per-resource status updates, re-ranking only the affected sites.
+    Disabled unless SITESIGHT_INGEST_TOKEN is set: ingested statuses are persisted by compaction."""
+    check_token(x_ingest_token, INGEST_TOKEN, "SITESIGHT_INGEST_TOKEN")
+    if not deltas:
+        raise HTTPException(status_code=422, detail="Empty telemetry batch")
+    try:
+        served, site_names = ingest_telemetry([delta.model_dump(exclude_none=True) for delta in deltas])
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    request.state.snapshot = served
+    records = served.index.records
+    return {
+        "applied": len(deltas),
+        "data_version": served.data_version,
+        "sites": {
+            name: {
+                "SiteHealthScore": records[name]["entry"]["SiteHealthScore"],
+                "RankScore": records[name]["entry"]["RankScore"],
+                "RankLabel": records[name]["RankLabel"]
+            } for name in site_names if name in records
         }
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage timings, cache hit ratios, request counts and latencies in the Prometheus text format"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (SITESIGHT_METRICS=0)")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-        # Get recommendations per resource
-        site_resources = df[df["SiteName"] == row["SiteName"]]
-        recs_per_site = {}
-        for _, res in site_resources.iterrows():
-            recs_per_site[res["ResourceName"]] = [
-                f"{r}" for r in predict_recommendations_ml(res)
-            ]
-
-        response.append({
-            "SiteName": row["SiteName"],
-            "RankScore": round(float(row["RankScore"]), 4),
-            "SiteHealthScore": round(float(row["SiteHealthScore"]), 2),
-            "HealthSignals": health_scores,
-            "Connectivity": site_resources["Connectivity"].mode()[0] if not site_resources.empty else "Unknown",
-            "Update": site_resources["Update"].mode()[0] if not site_resources.empty else "Unknown",
-            "Alerts": site_resources["Alerts"].mode()[0] if not site_resources.empty else "Unknown",
-            "Security": site_resources["Security"].mode()[0] if not site_resources.empty else "Unknown",
-            "Recommendations": recs_per_site
-        })
-
-    # 🔹 Save the entire response once (not inside loop!)
-    with open("ranked_sites.json", "w") as f:
-        json.dump(response, f, indent=2)
-    with open("../frontend/public/ranked_sites.json", "w") as f:
-        json.dump(response, f, indent=2)
-
-    return JSONResponse(content=response)
+@app.post("/admin/reload")
+def admin_reload(x_admin_token: str = Header(None)):
+    """Reload telemetry and models now instead of waiting for the file watcher.
+    Disabled unless SITESIGHT_ADMIN_TOKEN is set (CORS lets any page call the API)."""
+    check_token(x_admin_token, ADMIN_TOKEN, "SITESIGHT_ADMIN_TOKEN")
+    try:
+        return reload()
+    except Exception as e:
+        logger.exception("Reload failed")
+        raise HTTPException(status_code=500, detail=f"Reload failed, still serving the previous version: {e}")
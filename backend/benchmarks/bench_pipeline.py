@@ -0,0 +1,85 @@
+"""Per-stage benchmark of the ranking pipeline on synthetic fleets.
+
+Run from backend/ (it loads the model bundle like the app does):
+
+    python benchmarks/bench_pipeline.py --sizes 1k,10k,100k
+    python benchmarks/bench_pipeline.py --sizes 1k,10k --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import orjson
+
+from common import DEFAULT_TYPES, compare_results, make_sites, measure, parse_sizes, size_label, write_results
+
+import app
+from aggregation import aggregate_sites, flatten_sites
+from model_bundle import load_models
+from resource_store import load_table, save_table
+
+def bench_models(bundle_path, compiled, repeat):
+    """Model loading: manifest, ranker validation and the recommendation table"""
+    def load():
+        models = load_models(bundle_path, compiled=compiled).validate()
+        return models, app.load_rec_table(models)
+
+    (models, rec_table), timing = measure(load, repeat)
+    return models, rec_table, {"model_load": timing}
+
+def bench_fleet(n_resources, models, rec_table, repeat, seed):
+    """Time every stage for one fleet size. Returns {stage: timing}."""
+    resource_types = [name[len("Type_"):] for name in models.rank_features if name.startswith("Type_")]
+    sites = make_sites(n_resources, seed=seed, resource_types=resource_types or DEFAULT_TYPES)
+    raw = orjson.dumps(sites)
+    timings = {}
+
+    _, timings["parse_json"] = measure(lambda: orjson.loads(raw), repeat)
+    table, timings["flatten"] = measure(lambda: flatten_sites(sites), repeat)
+    _, timings["aggregate"] = measure(lambda: aggregate_sites(table, app.score_maps), repeat)
+    records, timings["rank"] = measure(lambda: app.rank_table(table, models), repeat)
+    recs, timings["recommend"] = measure(lambda: app.recommend_sites(sites, models, dict(rec_table)), repeat)
+
+    response = [{**records[name]["entry"], "Recommendations": recs.get(name, {})} for name in records]
+    _, timings["serialize"] = measure(lambda: orjson.dumps(response), repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sites_table")
+        _, timings["table_save"] = measure(lambda: save_table(table, path), repeat)
+        # Loading only maps the columns; aggregating from them is what actually reads them
+        _, timings["table_load_rank"] = measure(
+            lambda: app.rank_table(load_table(path)[0], models), repeat
+        )
+
+    for timing in timings.values():
+        timing["resources_per_s"] = round(n_resources / timing["median"]) if timing["median"] else None
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ranking pipeline stages on synthetic fleets")
+    parser.add_argument("--sizes", default="1k,10k,100k", help="fleet sizes in resources, e.g. 1k,10k,100k,1M")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (the median is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bundle", default=os.environ.get("SITESIGHT_MODEL_BUNDLE", "model_bundle"))
+    parser.add_argument("--compiled", default="auto", choices=["auto", "all", "none"], help="model predictors to use")
+    parser.add_argument("--output", help="results file (default benchmarks/results/pipeline-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown flagged as a regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    models, rec_table, results = bench_models(args.bundle, args.compiled, args.repeat)
+    print(f"{'model_load':<28}{results['model_load']['median'] * 1000:>10.1f} ms")
+    for n in parse_sizes(args.sizes):
+        for stage, timing in bench_fleet(n, models, rec_table, args.repeat, args.seed).items():
+            results[f"{stage}@{size_label(n)}"] = timing
+            print(f"{stage + '@' + size_label(n):<28}{timing['median'] * 1000:>10.1f} ms"
+                  f"{timing['resources_per_s'] or 0:>14,} resources/s")
+
+    path = write_results("pipeline", results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+    if args.compare and compare_results(results, args.compare, "median", args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+# The benchmarks import the backend modules and use its relative data paths, like the app
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from generate_data import DEGRADED_SITE_SHARE, STATUSES, status_cdfs  # noqa: E402
+
+DEFAULT_TYPES = [
+    "microsoft.hybridcompute/machines",
+    "microsoft.kubernetes/connectedclusters",
+    "microsoft.azurestackhci/clusters",
+    "microsoft.deviceregistry/assets",
+    "microsoft.deviceregistry/devices",
+]
+# Resources per site, roughly the shape of the sample fleet (most sites have one resource)
+SITE_SIZE_WEIGHTS = np.array([0.55, 0.25, 0.1, 0.06, 0.04])
+
+# -----------------------------
+# Synthetic fleets
+# -----------------------------
+def make_sites(n_resources, seed=0, resource_types=DEFAULT_TYPES):
+    """Nested sites JSON ({SiteName, Resources}) with exactly `n_resources` resources.
+
+    Each site gets 1-5 distinct resource types and statuses drawn from the generator's
+    realistic distribution, so benchmarks see the same status mix as generated fleets.
+    """
+    rng = np.random.default_rng(seed)
+    cdfs = status_cdfs("realistic")
+    max_size = min(len(SITE_SIZE_WEIGHTS), len(resource_types))
+    weights = SITE_SIZE_WEIGHTS[:max_size] / SITE_SIZE_WEIGHTS[:max_size].sum()
+
+    sizes = []
+    remaining = n_resources
+    while remaining > 0:
+        batch = rng.choice(np.arange(1, max_size + 1), size=max(remaining // 2, 1), p=weights)
+        for size in batch.tolist():
+            size = min(size, remaining)
+            sizes.append(size)
+            remaining -= size
+            if remaining == 0:
+                break
+
+    degraded = np.repeat(rng.random(len(sizes)) < DEGRADED_SITE_SHARE, sizes)
+    statuses = {}
+    for col, (healthy, sick) in cdfs.items():
+        u = rng.random(n_resources)
+        codes = np.where(degraded, np.searchsorted(sick, u, side="right"), np.searchsorted(healthy, u, side="right"))
+        statuses[col] = np.asarray(STATUSES[col], dtype=object)[np.minimum(codes, len(STATUSES[col]) - 1)]
+
+    sites, row = [], 0
+    for i, size in enumerate(sizes):
+        site_name = f"site-{i:07d}"
+        resources = []
+        for type_index in rng.choice(len(resource_types), size=size, replace=False).tolist():
+            resource_type = resource_types[type_index]
+            resources.append({
+                "ResourceName": f"{site_name}-{resource_type.split('/')[-1]}",
+                "ResourceType": resource_type,
+                **{col: {"status": statuses[col][row]} for col in STATUSES},
+            })
+            row += 1
+        sites.append({"SiteName": site_name, "Resources": resources})
+    return sites
+
+def parse_sizes(text):
+    """"1k,10k,1M" -> [1000, 10000, 1000000]"""
+    units = {"k": 1_000, "m": 1_000_000}
+    return [int(float(s[:-1]) * units[s[-1].lower()]) if s[-1].lower() in units else int(s) for s in text.split(",")]
+
+def size_label(n):
+    return f"{n // 1_000_000}M" if n >= 1_000_000 and n % 1_000_000 == 0 else f"{n // 1000}k" if n >= 1000 and n % 1000 == 0 else str(n)
+
+# -----------------------------
+# Measuring
+# -----------------------------
+def measure(fn, repeat=3):
+    """Run `fn` `repeat` times, returning (its last result, timing summary in seconds)"""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, {"median": statistics.median(times), "min": min(times), "runs": len(times)}
+
+def percentiles(latencies):
+    values = np.asarray(latencies) * 1000
+    if len(values) == 0:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+# -----------------------------
+# Results
+# -----------------------------
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(kind, results, path=None, params=None):
+    """Store results as JSON (by default in benchmarks/results/<kind>-<time>.json), returning the path"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    document = {
+        "kind": kind,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "params": params or {},
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    return path
+
+def compare_results(results, baseline_path, metric, threshold=0.2):
+    """Print `metric` of every result next to the baseline's. Returns the keys that got slower
+    by more than `threshold` (0.2 = 20%)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\n{'benchmark':<28}{'baseline':>12}{'current':>12}{'change':>9}")
+    for key, current in results.items():
+        if key not in baseline or metric not in baseline[key] or metric not in current:
+            continue
+        before, after = baseline[key][metric], current[metric]
+        change = after / before - 1 if before else 0.0
+        flag = "  <- slower" if change > threshold else ""
+        if flag:
+            regressions.append(key)
+        print(f"{key:<28}{before:>12.4g}{after:>12.4g}{change:>+8.0%}{flag}")
+    return regressions
@@ -0,0 +1,163 @@
+"""Load test of the API: concurrent clients issuing a weighted mix of requests.
+
+By default the app runs in-process (FastAPI TestClient) on a synthetic fleet written to a
+temp directory; with --url it hits a running server instead (e.g. uvicorn app:app).
+
+    python benchmarks/load_test.py --resources 10k --concurrency 4 --duration 10
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --duration 30
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import orjson
+
+from common import DEFAULT_TYPES, compare_results, make_sites, parse_sizes, percentiles, write_results
+
+# Request kinds and their default share of the traffic
+DEFAULT_MIX = "sites=0.6,detail=0.3,full=0.1"
+
+def request_makers(site_names):
+    """Request kind -> function(rng) returning (path, params, headers)"""
+    return {
+        # The dashboard's first page and a filtered page
+        "sites": lambda rng: ("/sites", {"limit": 50, "min_label": rng.choice([None, 2])}, {}),
+        "detail": lambda rng: (f"/sites/{rng.choice(site_names)}", {}, {}),
+        # The full ranking, half the time revalidated with the ETag of a previous response
+        "full": lambda rng: ("/", {}, {}),
+        "ndjson": lambda rng: ("/", {"format": "ndjson"}, {}),
+    }
+
+def start_in_process(n_resources, bundle_path, seed):
+    """Serve a synthetic fleet from an in-process app, returning a client factory"""
+    workdir = tempfile.mkdtemp(prefix="sitesight-load-")
+    os.makedirs(os.path.join(workdir, "data"))
+    with open(os.path.join(workdir, "data", "sites_clean.json"), "wb") as f:
+        f.write(orjson.dumps(make_sites(n_resources, seed=seed, resource_types=DEFAULT_TYPES)))
+    os.environ["SITESIGHT_MODEL_BUNDLE"] = os.path.abspath(bundle_path)
+    os.environ.setdefault("SITESIGHT_RELOAD_INTERVAL", "0")
+    # The app reads its data relative to the working directory
+    os.chdir(workdir)
+
+    from fastapi.testclient import TestClient
+    import app
+
+    lifespan = TestClient(app.app)
+    lifespan.__enter__()
+    return lambda: TestClient(app.app), lifespan
+
+def start_remote(url):
+    import httpx
+    return lambda: httpx.Client(base_url=url, timeout=60), None
+
+def run_load(make_client, mix, concurrency, duration, max_requests, seed):
+    """Issue requests from `concurrency` threads until `duration` seconds or `max_requests`
+    have passed. Returns ({kind: [latency seconds]}, errors, wall seconds)."""
+    client = make_client()
+    site_names = [item["SiteName"] for item in client.get("/sites", params={"limit": 1000}).json()["items"]]
+    if not site_names:
+        raise SystemExit("The app serves no sites")
+    makers = request_makers(site_names)
+    kinds, weights = zip(*mix.items())
+    etag = {}
+
+    # Warm up once per kind so one-off work (e.g. building the full response) isn't measured
+    for kind in kinds:
+        path, params, headers = makers[kind](random.Random(seed))
+        client.get(path, params={k: v for k, v in params.items() if v is not None}, headers=headers)
+
+    latencies = {kind: [] for kind in kinds}
+    errors = []
+    lock = threading.Lock()
+    issued = 0
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        nonlocal issued
+        rng = random.Random(seed + worker_id)
+        worker_client = make_client()
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and issued >= max_requests:
+                    return
+                issued += 1
+            kind = rng.choices(kinds, weights)[0]
+            path, params, headers = makers[kind](rng)
+            if kind == "full" and etag.get("value") and rng.random() < 0.5:
+                headers = {"If-None-Match": etag["value"]}
+            start = time.perf_counter()
+            response = worker_client.get(path, params={k: v for k, v in params.items() if v is not None}, headers=headers)
+            _ = response.content
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code in (200, 304):
+                    latencies[kind].append(elapsed)
+                    if kind == "full" and "etag" in response.headers:
+                        etag["value"] = response.headers["etag"]
+                else:
+                    errors.append(f"{response.status_code} {path}")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the ranking API and report latency percentiles")
+    parser.add_argument("--url", help="test a running server instead of an in-process app")
+    parser.add_argument("--resources", default="10k", help="synthetic fleet size for the in-process app")
+    parser.add_argument("--bundle", default=os.environ.get("SITESIGHT_MODEL_BUNDLE", "model_bundle"))
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"request kinds and weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default benchmarks/results/load-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown flagged as a regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    mix = {kind: float(weight) for kind, weight in (part.split("=") for part in args.mix.split(","))}
+    unknown = set(mix) - set(request_makers([]))
+    if unknown:
+        parser.error(f"Unknown request kinds {sorted(unknown)}")
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+
+    if args.url:
+        make_client, lifespan = start_remote(args.url)
+    else:
+        make_client, lifespan = start_in_process(parse_sizes(args.resources)[0], args.bundle, args.seed)
+    try:
+        latencies, errors, wall = run_load(make_client, mix, args.concurrency, args.duration, args.requests, args.seed)
+    finally:
+        if lifespan is not None:
+            lifespan.__exit__(None, None, None)
+
+    total = sum(len(values) for values in latencies.values())
+    results = {kind: percentiles(values) for kind, values in latencies.items()}
+    results["all"] = percentiles([v for values in latencies.values() for v in values])
+    results["all"]["throughput_rps"] = round(total / wall, 1) if wall else None
+    results["all"]["errors"] = len(errors)
+
+    print(f"{'request':<10}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, stats in results.items():
+        if stats["count"]:
+            print(f"{kind:<10}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p90_ms']:>10.2f}"
+                  f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    print(f"{total} requests in {wall:.1f} s: {results['all']['throughput_rps']} req/s, {len(errors)} errors")
+
+    path = write_results("load", results, output, params=vars(args))
+    print(f"Results written to {path}")
+    if compare and compare_results(results, compare, "p99_ms", args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from aggregation import STATUS_COLUMNS
+
+# -----------------------------
+# Status scores
+# -----------------------------
+# Shared by train_recommendation.py and app.py, so serving scores statuses exactly like training did
+connectivity_map = {"Connected": 1, "NeedsAttention": 0.5, "NotRecentlyConnected": 0}
+update_map = {"UptoDate": 1, "UpdateAvailable": 0.5, "NeedsAttention": 0.5, "Unknown": 0, "UpdateInProgress": 0.5}
+alert_map = {"NoAlerts": 1, "NeedsAttention": 0.5}
+security_map = {"Compliant": 1, "NonCompliant": 0.5}
+score_maps = {"Connectivity": connectivity_map, "Update": update_map, "Alerts": alert_map, "Security": security_map}
+
+# -----------------------------
+# Recommendation catalog
+# -----------------------------
+recommendations = {
+    "Connectivity": [
+        "Check site network/firewall",
+        "Verify DNS resolution",
+        "Inspect router/switch logs",
+        "Check ISP/service provider status",
+        "Run ping and traceroute diagnostics",
+        "Test bandwidth and latency",
+        "Validate VPN or private link tunnels",
+        "Check DHCP/Static IP configuration",
+        "Review load balancer health",
+        "Examine physical cabling/ports",
+        "Monitor packet loss and jitter",
+        "Audit QoS or traffic shaping policies",
+        "Verify SSL/TLS handshake for secure connections",
+        "Confirm routing table consistency",
+        "Check wireless interference (if Wi-Fi dependent)"
+    ],
+    "Update": [
+        "Check for recent update availability",
+        "Verify if update download failed",
+        "Check permissions for update installation",
+        "Confirm device has sufficient disk space",
+        "Validate system date/time (NTP sync)",
+        "Review update installation logs",
+        "Restart services post-update if required",
+        "Ensure rollback/recovery points are set",
+        "Check dependency patches or prerequisites",
+        "Cross-check update version compatibility",
+        "Audit devices with pending reboots",
+        "Review group policy or WSUS configurations",
+        "Check update throttling or bandwidth caps",
+        "Ensure security patches applied before deadlines",
+        "Test update in staging before full rollout"
+    ],
+    "Alerts": [
+        "Review alert logs for recurring issues",
+        "Classify alerts by severity",
+        "Escalate high-priority alerts",
+        "Set alert suppression for false positives",
+        "Define auto-remediation playbooks",
+        "Tag alerts with responsible owners",
+        "Check alert thresholds and fine-tune",
+        "Validate alert integration with ticketing system",
+        "Review alert correlation across systems",
+        "Verify escalation paths for after-hours",
+        "Archive and report historical alerts",
+        "Perform RCA (Root Cause Analysis) on repeated alerts",
+        "Ensure monitoring agents are healthy",
+        "Simulate incident scenarios for alert validation",
+        "Audit alert notifications (email/SMS/webhook)"
+    ],
+    "Security": [
+        "Check patch compliance",
+        "Validate access control policies",
+        "Run vulnerability scan",
+        "Verify antivirus/EDR signatures updated",
+        "Confirm encryption at rest and in transit",
+        "Audit expired or weak TLS certificates",
+        "Check multi-factor authentication enforcement",
+        "Review firewall/NSG rules",
+        "Audit privileged account usage",
+        "Ensure least privilege principle applied",
+        "Check endpoint hardening (disable unused ports)",
+        "Run penetration test in staging environment",
+        "Review SIEM dashboards for anomalies",
+        "Verify data backup encryption",
+        "Check compliance with GDPR/ISO/NIST/PCI standards"
+    ]
+}
+
+# -----------------------------
+# Rule-based recommendations
+# -----------------------------
+rule_based_triggers = {
+    "Connectivity": ["NotRecentlyConnected", "NeedsAttention"],
+    "Update": ["NeedsAttention", "UpdateInProgress", "UpdateAvailable"],
+    "Alerts": ["NeedsAttention"],
+    "Security": ["NonCompliant"]
+}
+
+def catalog_pick(category, statuses):
+    """Deterministic action of `category` for a status tuple: a stable hash (unlike Python's
+    salted str hash, the same in every process and run) indexes the category's catalog"""
+    digest = hashlib.sha1("|".join([category, *map(str, statuses)]).encode()).digest()
+    actions = recommendations[category]
+    return actions[int.from_bytes(digest[:8], "big") % len(actions)]
+
+@lru_cache(maxsize=4096)
+def rule_based_for_statuses(statuses):
+    """Deterministic rule-based recommendations of a (Connectivity, Update, Alerts, Security)
+    tuple. They only depend on the tuple, so each combination is computed once."""
+    status = dict(zip(STATUS_COLUMNS, statuses))
+    recs = [
+        catalog_pick(category, statuses)
+        for category, triggers in rule_based_triggers.items() if status[category] in triggers
+    ]
+    return tuple(recs[:3]) if recs else ("No action required",)
+
+def rule_based_recommendations_batch(df, rng=None):
+    """Up to three actions per row of `df`, one per category whose status needs attention.
+    Deterministic unless a numpy Generator `rng` is given, whose draws are reproducible for a given seed."""
+    if rng is None:
+        return [list(rule_based_for_statuses(key)) for key in df[STATUS_COLUMNS].itertuples(index=False, name=None)]
+    recs = [[] for _ in range(len(df))]
+    for category, triggers in rule_based_triggers.items():
+        rows = np.flatnonzero(df[category].isin(triggers).to_numpy())
+        picks = rng.integers(len(recommendations[category]), size=len(rows))
+        for i, pick in zip(rows.tolist(), picks.tolist()):
+            recs[i].append(recommendations[category][pick])
+    return [r[:3] if r else ["No action required"] for r in recs]
@@ -0,0 +1,24 @@
+import asyncio
+
+class SingleFlight:
+    """Coalesces concurrent async calls for the same key into one in-flight computation.
+
+    The first caller for a key starts `compute()`; callers arriving while it runs await
+    the same result instead of starting their own. Once it finishes the key is free
+    again. A waiter that is cancelled (e.g. its client disconnected) does not cancel
+    the computation the others are waiting for.
+    """
+
+    def __init__(self):
+        self.flights = {}
+
+    async def run(self, key, compute):
+        """Result of `compute()` (a coroutine function), shared with concurrent callers of `key`"""
+        # Futures belong to one event loop, so flights are per loop
+        flight_key = (asyncio.get_running_loop(), key)
+        future = self.flights.get(flight_key)
+        if future is None:
+            future = asyncio.ensure_future(compute())
+            self.flights[flight_key] = future
+            future.add_done_callback(lambda _: self.flights.pop(flight_key, None))
+        return await asyncio.shield(future)
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+import orjson
+
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli variants are only written when the package is installed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+def atomic_write(path, data):
+    """Write `data` to a temp file next to `path` and rename it over `path`, so readers
+    only ever see the old or the new complete file"""
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def publish_directory(tmp_path, path, keep=3):
+    """Make the finished directory `tmp_path` appear at `path` in one atomic step.
+
+    The directory is renamed to a new version next to `path` (`<path>.v<time>`) and
+    `path` becomes a symlink to it, replaced with os.replace, so readers never find
+    `path` missing or half written. Readers that resolved the link (os.path.realpath)
+    keep reading their own version; the `keep` newest versions are kept for them. A
+    plain directory at `path` is moved aside as the oldest version on the first swap.
+    Without symlink support (e.g. Windows without the privilege) the directories are
+    renamed instead, leaving `path` briefly missing.
+    """
+    parent = os.path.dirname(path) or "."
+    prefix = f"{os.path.basename(path)}.v"
+    version = f"{prefix}{time.time_ns():020d}"
+    link_path = f"{path}.link-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.symlink(version, link_path, target_is_directory=True)
+    except (OSError, NotImplementedError):
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return
+    try:
+        os.rename(tmp_path, os.path.join(parent, version))
+        if os.path.isdir(path) and not os.path.islink(path):
+            os.rename(path, os.path.join(parent, f"{prefix}{0:020d}"))
+        os.replace(link_path, path)
+    finally:
+        if os.path.lexists(link_path):
+            os.remove(link_path)
+    versions = sorted(name for name in os.listdir(parent) if name.startswith(prefix) and name[len(prefix):].isdigit())
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+class ExportWriter:
+    """Debounced background writer of the ranked_sites.json exports.
+
+    `schedule(source)` only records the latest `source` (a callable returning the
+    compact JSON bytes); a daemon thread calls it once no new schedule arrived for
+    `debounce` seconds and writes every path atomically, plus `.gz` / `.br` variants
+    when requested. A steady stream of schedules can't postpone the write for more
+    than `max_delay` seconds after the first pending one. Unchanged content (same hash
+    as the last write) is skipped.
+    """
+
+    def __init__(self, paths, debounce=2.0, compress=(), indent=False, max_delay=10.0):
+        self.paths = list(paths)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.compress = set(compress)
+        if "br" in self.compress and brotli is None:
+            logger.warning("Brotli exports requested but brotli is not installed (pip install brotli); skipping .br")
+            self.compress.discard("br")
+        self.indent = indent
+        self.last_digest = None
+        self.condition = threading.Condition()
+        self.source = None
+        self.deadline = None
+        self.first_pending = None
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="ranked-sites-export", daemon=True)
+            self.thread.start()
+
+    def schedule(self, source):
+        with self.condition:
+            now = time.monotonic()
+            if self.source is None:
+                self.first_pending = now
+            self.source = source
+            self.deadline = min(now + self.debounce, self.first_pending + self.max_delay)
+            self.condition.notify()
+
+    def stop(self, flush=True):
+        """Stop the writer thread, writing a still pending export first when `flush`"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if flush:
+            self._write_pending()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (self.source is None or time.monotonic() < self.deadline):
+                    timeout = None if self.source is None else self.deadline - time.monotonic()
+                    self.condition.wait(timeout)
+                if self.stopped:
+                    return
+            try:
+                self._write_pending()
+            except Exception:
+                logger.exception("Exporting ranked sites failed")
+
+    def _write_pending(self):
+        with self.condition:
+            source, self.source = self.source, None
+        if source is not None:
+            self.write(source())
+
+    def write(self, body):
+        """Write `body` to all export paths unless it is unchanged since the last write.
+        Returns whether anything was written."""
+        digest = hashlib.sha256(body).hexdigest()
+        if digest == self.last_digest:
+            return False
+        with metrics.span("export_write"):
+            self._write_variants(body)
+        self.last_digest = digest
+        return True
+
+    def _write_variants(self, body):
+        if self.indent:
+            body = orjson.dumps(orjson.loads(body), option=orjson.OPT_INDENT_2)
+        variants = {"": body}
+        if "gzip" in self.compress:
+            variants[".gz"] = gzip.compress(body, compresslevel=6, mtime=0)
+        if "br" in self.compress:
+            variants[".br"] = brotli.compress(body)
+        for path in self.paths:
+            if not os.path.isdir(os.path.dirname(path) or "."):
+                continue
+            for suffix, data in variants.items():
+                atomic_write(path + suffix, data)
@@ -1,54 +1,317 @@
+import argparse
+import contextlib
+import functools
+import math
+import os
+import re
+
+import numpy as np
+import orjson
 import pandas as pd
-import ast
-import random
-import json
-
-# Load CSV
-df = pd.read_csv("sites_telemetry_data.csv")
-
-# Status pools
-connectivity_statuses = ["Connected", "NotRecentlyConnected", "NeedsAttention"]
-update_statuses = ["Unknown", "UpdateAvailable", "UptoDate", "UpdateInProgress", "NeedsAttention"]
-alert_statuses = ["NoAlerts", "NeedsAttention"]
-security_statuses = ["Compliant", "NonCompliant"]
-
-# Dictionary to store structured JSON
-sites_dict = {}
-
-for _, row in df.iterrows():
-    site_name = str(row["Name"]).strip()
-    resource_type_json = str(row["ResourceTypeCount"]).strip()
-
-    # Parse JSON safely
-    try:
-        resource_types = ast.literal_eval(resource_type_json)
-    except Exception:
-        resource_types = {}
-
-    if site_name not in sites_dict:
-        sites_dict[site_name] = {"SiteName": site_name, "Resources": []}
-
-    # Add only **one resource per type**
-    for r_type in resource_types.keys():
-        # Check if resource type already added
-        if any(res["ResourceType"] == r_type for res in sites_dict[site_name]["Resources"]):
-            continue
-
-        resource_entry = {
-            "ResourceName": f"{site_name}-{r_type.split('/')[-1]}",
-            "ResourceType": r_type,
-            "Connectivity": {"status": random.choice(connectivity_statuses)},
-            "Update": {"status": random.choice(update_statuses)},
-            "Alerts": {"status": random.choice(alert_statuses)},
-            "Security": {"status": random.choice(security_statuses)},
-        }
-        sites_dict[site_name]["Resources"].append(resource_entry)
-
-# Convert dict → list for JSON
-site_list = list(sites_dict.values())
-
-# Save JSON
-with open("sites_clean.json", "w") as f:
-    json.dump(site_list, f, indent=2)
-
-print("✅ Nested JSON created: sites_clean.json")
+
+from aggregation import ResourceTable
+from resource_store import StringColumn, save_table
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is only available when pyarrow is installed
+    pa = pq = None
+
+# -----------------------------
+# Status pools and distributions
+# -----------------------------
+STATUSES = {
+    "Connectivity": ["Connected", "NotRecentlyConnected", "NeedsAttention"],
+    "Update": ["Unknown", "UpdateAvailable", "UptoDate", "UpdateInProgress", "NeedsAttention"],
+    "Alerts": ["NoAlerts", "NeedsAttention"],
+    "Security": ["Compliant", "NonCompliant"],
+}
+
+# Status weights (same order as STATUSES) for resources of healthy and of degraded sites.
+# Problems cluster: a degraded site's resources are far more likely to need attention.
+REALISTIC_WEIGHTS = {
+    "Connectivity": ([0.88, 0.08, 0.04], [0.45, 0.25, 0.30]),
+    "Update": ([0.05, 0.25, 0.60, 0.07, 0.03], [0.10, 0.35, 0.15, 0.10, 0.30]),
+    "Alerts": ([0.90, 0.10], [0.40, 0.60]),
+    "Security": ([0.85, 0.15], [0.40, 0.60]),
+}
+DEGRADED_SITE_SHARE = 0.15
+
+def status_cdfs(distribution):
+    """{column: (healthy cdf, degraded cdf)} for the given distribution"""
+    cdfs = {}
+    for col, statuses in STATUSES.items():
+        if distribution == "uniform":
+            # What the original generator did (random.choice per status)
+            weights = (np.ones(len(statuses)), np.ones(len(statuses)))
+        else:
+            weights = tuple(np.asarray(w, dtype=float) for w in REALISTIC_WEIGHTS[col])
+        cdfs[col] = tuple(np.cumsum(w) / w.sum() for w in weights)
+    return cdfs
+
+# -----------------------------
+# Parsing
+# -----------------------------
+# ResourceTypeCount holds a dict literal such as {'microsoft.hybridcompute/machines': 3};
+# only its keys are used, so they are pulled out with a regex instead of literal_eval
+RESOURCE_TYPE_KEY = re.compile(r"""["']([^"']+)["']\s*:""")
+
+@functools.lru_cache(maxsize=None)
+def parse_resource_types(type_count):
+    """Resource types listed in a ResourceTypeCount cell (in order, without duplicates).
+    Cached, as the same few type mixes repeat across most sites."""
+    return tuple(dict.fromkeys(RESOURCE_TYPE_KEY.findall(type_count)))
+
+# -----------------------------
+# Generation
+# -----------------------------
+class FleetGenerator:
+    """Builds the fleet one CSV chunk at a time.
+
+    Every source site is emitted `scale` times on average (copies after the first get a
+    `-s<n>` suffix; a fractional scale keeps a random share of the sites), with one
+    resource per resource type and site. State kept across chunks is only the per-site
+    set of seen types and the generated rows as small integer codes.
+
+    Site copies and every status column draw from their own random stream, consumed in
+    CSV order, so a seeded fleet does not depend on the chunk size.
+    """
+
+    def __init__(self, scale=1.0, seed=None, distribution="realistic"):
+        self.scale = scale
+        self.cdfs = status_cdfs(distribution)
+        streams = np.random.SeedSequence(seed).spawn(1 + len(self.cdfs))
+        self.site_rng = np.random.default_rng(streams[0])
+        self.status_rngs = {col: np.random.default_rng(s) for col, s in zip(self.cdfs, streams[1:])}
+        self.copies = {}        # source site name -> indices of its generated sites
+        self.site_names = []
+        self.site_types = []    # per generated site, the set of its resource type codes
+        self.site_degraded = []
+        self.type_codes = {}
+        self.type_names = []
+        self.rows = []          # per chunk: (site index, type code, {column: status code}) arrays
+
+    def _site_copies(self, name):
+        copies = self.copies.get(name)
+        if copies is None:
+            n = math.floor(self.scale)
+            n += self.site_rng.random() < self.scale - n
+            copies = self.copies[name] = []
+            for i in range(n):
+                copies.append(len(self.site_names))
+                self.site_names.append(name if i == 0 else f"{name}-s{i}")
+                self.site_types.append(set())
+                self.site_degraded.append(self.site_rng.random() < DEGRADED_SITE_SHARE)
+        return copies
+
+    def _type_code(self, type_name):
+        code = self.type_codes.get(type_name)
+        if code is None:
+            code = self.type_codes[type_name] = len(self.type_names)
+            self.type_names.append(type_name)
+        return code
+
+    def add_chunk(self, chunk):
+        """Add the sites of one CSV chunk, returning the chunk's new resource rows"""
+        sites, types = [], []
+        for name, type_count in zip(chunk["Name"].str.strip(), chunk["ResourceTypeCount"].str.strip()):
+            resource_types = [self._type_code(t) for t in parse_resource_types(type_count)]
+            for site in self._site_copies(name):
+                seen = self.site_types[site]
+                for code in resource_types:
+                    # Add only **one resource per type**
+                    if code not in seen:
+                        seen.add(code)
+                        sites.append(site)
+                        types.append(code)
+
+        sites = np.asarray(sites, dtype=np.int64)
+        degraded = np.asarray(self.site_degraded, dtype=bool)[sites] if len(sites) else np.zeros(0, dtype=bool)
+        statuses = {}
+        for col, (healthy, sick) in self.cdfs.items():
+            u = self.status_rngs[col].random(len(sites))
+            codes = np.where(degraded, np.searchsorted(sick, u, side="right"), np.searchsorted(healthy, u, side="right"))
+            statuses[col] = np.minimum(codes, len(STATUSES[col]) - 1).astype(np.int8)
+        rows = (sites, np.asarray(types, dtype=np.int32), statuses)
+        self.rows.append(rows)
+        return rows
+
+    def resource_records(self, rows):
+        """Flat resource records ({SiteName, ResourceName, ResourceType, <status>...}) of some rows"""
+        sites, types, statuses = rows
+        columns = {col: np.asarray(STATUSES[col], dtype=object)[codes] for col, codes in statuses.items()}
+        for i, (site, code) in enumerate(zip(sites.tolist(), types.tolist())):
+            site_name, type_name = self.site_names[site], self.type_names[code]
+            yield {
+                "SiteName": site_name,
+                "ResourceName": f"{site_name}-{type_name.split('/')[-1]}",
+                "ResourceType": type_name,
+                **{col: values[i] for col, values in columns.items()},
+            }
+
+    def grouped_rows(self):
+        """All rows ordered by site (first-seen order), plus each site's row offsets"""
+        chunks = self.rows or [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                                {col: np.zeros(0, dtype=np.int8) for col in STATUSES})]
+        sites = np.concatenate([rows[0] for rows in chunks])
+        types = np.concatenate([rows[1] for rows in chunks])
+        statuses = {col: np.concatenate([rows[2][col] for rows in chunks]) for col in STATUSES}
+        order = np.argsort(sites, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(sites, minlength=len(self.site_names)))])
+        return (sites[order], types[order], {col: c[order] for col, c in statuses.items()}), offsets
+
+    def iter_sites(self):
+        """The generated sites in the nested {SiteName, Resources} format, in first-seen order"""
+        rows, offsets = self.grouped_rows()
+        records = self.resource_records(rows)
+        for site, site_name in enumerate(self.site_names):
+            resources = []
+            for _ in range(offsets[site + 1] - offsets[site]):
+                record = next(records)
+                resources.append({
+                    "ResourceName": record["ResourceName"],
+                    "ResourceType": record["ResourceType"],
+                    **{col: {"status": record[col]} for col in STATUSES},
+                })
+            yield {"SiteName": site_name, "Resources": resources}
+
+    def to_table(self):
+        """The generated resources as a ResourceTable, without going through the nested JSON"""
+        (sites, types, statuses), _ = self.grouped_rows()
+        site_names = np.asarray(self.site_names, dtype=object)[sites]
+        type_names = np.asarray(self.type_names, dtype=object)
+        suffixes = np.asarray([t.split("/")[-1] for t in self.type_names], dtype=object)
+        # Sorted categories, exactly as flatten_sites factorizes them
+        site_codes, site_categories = pd.factorize(site_names, sort=True)
+        type_codes, type_categories = pd.factorize(type_names[types], sort=True)
+        status_codes, status_names = {}, {}
+        for col, codes in statuses.items():
+            codes, categories = pd.factorize(np.asarray(STATUSES[col], dtype=object)[codes], sort=True)
+            status_codes[col] = codes.astype(np.int32)
+            status_names[col] = np.asarray(categories, dtype=object)
+        return ResourceTable(
+            site_names=np.asarray(site_categories, dtype=object),
+            site_codes=site_codes.astype(np.int32),
+            resource_names=StringColumn.from_strings(site_names + "-" + suffixes[types] if len(sites) else []),
+            type_names=np.asarray(type_categories, dtype=object),
+            type_codes=type_codes.astype(np.int32),
+            status_names=status_names,
+            status_codes=status_codes,
+        )
+
+# -----------------------------
+# Output
+# -----------------------------
+class AtomicFile:
+    """Binary file written under a temp name and renamed into place when closed without error"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp-{os.getpid()}"
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, "wb")
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+def write_sites_json(path, sites, batch=1000):
+    """Stream the nested sites to a (compact) JSON array, the format the app and training read"""
+    with AtomicFile(path) as f:
+        separator = b"["
+        pending = []
+        for site in sites:
+            pending.append(orjson.dumps(site))
+            if len(pending) == batch:
+                f.write(separator + b",".join(pending))
+                separator, pending = b",", []
+        if pending:
+            f.write(separator + b",".join(pending))
+            separator = b","
+        f.write(b"]" if separator == b"," else b"[]")
+
+def parquet_schema():
+    string = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [("SiteName", pa.string()), ("ResourceName", pa.string()), ("ResourceType", string)]
+        + [(col, string) for col in STATUSES]
+    )
+
+def parquet_table(generator, rows):
+    sites, types, statuses = rows
+    site_names = np.asarray(generator.site_names, dtype=object)[sites]
+    type_names = np.asarray(generator.type_names, dtype=object)
+    suffixes = np.asarray([t.split("/")[-1] for t in generator.type_names], dtype=object)
+    columns = {
+        "SiteName": pa.array(site_names, type=pa.string()),
+        "ResourceName": pa.array(site_names + "-" + suffixes[types] if len(sites) else [], type=pa.string()),
+        "ResourceType": pa.DictionaryArray.from_arrays(pa.array(types, type=pa.int32()), pa.array(type_names, type=pa.string())),
+    }
+    for col, codes in statuses.items():
+        columns[col] = pa.DictionaryArray.from_arrays(
+            pa.array(codes.astype(np.int32), type=pa.int32()), pa.array(STATUSES[col], type=pa.string())
+        )
+    return pa.table(columns, schema=parquet_schema())
+
+def generate(args):
+    generator = FleetGenerator(scale=args.scale, seed=args.seed, distribution=args.distribution)
+    chunks = pd.read_csv(
+        args.input, usecols=["Name", "ResourceTypeCount"], dtype=str,
+        keep_default_na=False, chunksize=args.chunksize
+    )
+
+    if args.parquet and pq is None:
+        raise SystemExit("Parquet output needs pyarrow (pip install pyarrow)")
+
+    with contextlib.ExitStack() as outputs:
+        ndjson = outputs.enter_context(AtomicFile(args.ndjson)) if args.ndjson else None
+        parquet = None
+        if args.parquet:
+            parquet = outputs.enter_context(pq.ParquetWriter(outputs.enter_context(AtomicFile(args.parquet)), parquet_schema()))
+        # Flat outputs are written per chunk as the rows are generated
+        for chunk in chunks:
+            rows = generator.add_chunk(chunk)
+            if ndjson:
+                ndjson.write(b"".join(orjson.dumps(r) + b"\n" for r in generator.resource_records(rows)))
+            if parquet:
+                parquet.write_table(parquet_table(generator, rows))
+    for path in (args.ndjson, args.parquet):
+        if path:
+            print(f"✅ Resource rows written: {path}")
+
+    if args.output:
+        write_sites_json(args.output, generator.iter_sites())
+        print(f"✅ Nested JSON created: {args.output}")
+    if args.table:
+        version = save_table(generator.to_table(), args.table)
+        print(f"✅ Resource table written: {args.table} (version {version})")
+    n_resources = sum(len(rows[0]) for rows in generator.rows)
+    print(f"{len(generator.site_names)} sites, {n_resources} resources, {len(generator.type_names)} resource types")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic site telemetry from the site inventory CSV")
+    parser.add_argument("--input", default="sites_telemetry_data.csv", help="CSV with Name and ResourceTypeCount columns")
+    parser.add_argument("--output", default="sites_clean.json", help="nested sites JSON (the app's format), '' to skip")
+    parser.add_argument("--ndjson", help="also write one flat resource row per line to this file")
+    parser.add_argument("--parquet", help="also write the flat resource rows as Parquet (needs pyarrow)")
+    parser.add_argument("--table", help="also write the columnar resource table directory the app memory-maps")
+    parser.add_argument("--scale", type=float, default=1.0, help="copies of every source site, e.g. 100 or 0.1")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible fleets")
+    parser.add_argument(
+        "--distribution", choices=["realistic", "uniform"], default="realistic",
+        help="status distribution: weighted with degraded sites, or uniform like the original generator"
+    )
+    parser.add_argument("--chunksize", type=int, default=50_000, help="CSV rows read at a time")
+    args = parser.parse_args(argv)
+    if args.scale <= 0:
+        parser.error("--scale must be positive")
+    generate(args)
+
+if __name__ == "__main__":
+    main()
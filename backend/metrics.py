@@ -0,0 +1,211 @@
+import bisect
+import contextvars
+import threading
+import time
+
+# Histogram buckets in seconds, from sub-millisecond lookups to multi-second full rankings
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage timings of the request being handled ({stage: seconds}), when it collects them
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+# -----------------------------
+# Metric types
+# -----------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, self.labels, values, (), value) for values, value in sorted(self.values.items())]
+
+class Gauge:
+    """A value read at scrape time from `collect()`, returning {label values: value}"""
+    kind = "gauge"
+
+    def __init__(self, registry, name, help, labels=(), collect=None):
+        self.registry = registry
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect() if self.collect is not None else {}
+        return [(self.name, self.labels, key, (), value) for key, value in sorted(values.items())]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not self.registry.enabled:
+            return
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][position] += 1
+            entry[1] += value
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", self.labels, key, (("le", format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", self.labels, key, (), total))
+            samples.append((f"{self.name}_count", self.labels, key, (), cumulative))
+        return samples
+
+# -----------------------------
+# Spans
+# -----------------------------
+class Span:
+    """Times one stage into the stage histogram and the current request's timings"""
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+# -----------------------------
+# Registry
+# -----------------------------
+class Metrics:
+    """In-process metrics registry rendered in the Prometheus text exposition format.
+
+    While disabled, counters and histograms ignore updates and `span()` returns a shared
+    no-op context manager (unless the current request collects stage timings for a
+    Server-Timing header), so instrumented hot paths cost next to nothing.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.stages = self.histogram(
+            "sitesight_stage_duration_seconds", "Duration of instrumented pipeline stages", ["stage"]
+        )
+        self.cache_lookups = self.counter(
+            "sitesight_cache_lookups_total", "Cache lookups by cache and result (hit or miss)", ["cache", "result"]
+        )
+
+    def add(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self.add(Gauge(self, name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(self, name, help, labels, buckets))
+
+    def span(self, stage):
+        """Context manager timing `stage`"""
+        if not self.enabled and request_timings.get() is None:
+            return NULL_SPAN
+        return Span(self, stage)
+
+    def record_stage(self, stage, seconds):
+        self.stages.observe(seconds, stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def cache(self, name, hits=0, misses=0):
+        """Count `hits` and `misses` of the named cache"""
+        if self.enabled:
+            if hits:
+                self.cache_lookups.inc(name, "hit", amount=hits)
+            if misses:
+                self.cache_lookups.inc(name, "miss", amount=misses)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, label_values, extra, value in metric.samples():
+                lines.append(f"{name}{format_labels(label_names, label_values, extra)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def collect_request_timings():
+    """Start collecting stage timings for the current request, returning (timings, reset token)"""
+    timings = {}
+    return timings, request_timings.set(timings)
+
+def server_timing_header(timings, total=None):
+    """Server-Timing header value of the collected {stage: seconds}"""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+# The registry the backend modules record into; app.py configures it
+metrics = Metrics()
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import types
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+
+from exporter import publish_directory
+from tree_predictor import load_compiled, save_compiled
+
+# Both are optional when serving a bundle with compiled models
+try:
+    import lightgbm as lgb
+except ImportError:
+    lgb = None
+try:
+    from sklearn.preprocessing import MultiLabelBinarizer
+except ImportError:
+    MultiLabelBinarizer = None
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 1
+MANIFEST = "manifest.json"
+RANKER_FILE = "ranker.txt"
+REC_MODEL_FILE = "rec_model.joblib"
+REC_TABLE_FILE = "rec_table.joblib"
+# NumPy tree predictors (tree_predictor.py) compiled from the ranker and the forest
+COMPILED_FILES = {"ranker": "ranker.npz", "rec_model": "rec_model.npz"}
+
+class BundleError(Exception):
+    """The model bundle is missing, of an unsupported format or internally inconsistent"""
+
+# -----------------------------
+# Writing
+# -----------------------------
+def save_bundle(path, rec_model, mlb, rec_features, ranker, rank_features, rec_table, metadata=None, compiled=None):
+    """Write all trained artifacts as one versioned bundle directory.
+
+    The ranker is stored in LightGBM's native text format and the forest uncompressed,
+    so it can be loaded with `mmap_mode`. The bundle is assembled in a temp directory
+    and published with `exporter.publish_directory`. `metadata` (e.g. training settings and metrics) is recorded
+    in the manifest under "training". `compiled` maps "ranker"/"rec_model" to their
+    compiled predictors. Returns the bundle version (a hash of its contents).
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    ranker.save_model(os.path.join(tmp_path, RANKER_FILE))
+    joblib.dump(rec_model, os.path.join(tmp_path, REC_MODEL_FILE))
+    joblib.dump(rec_table, os.path.join(tmp_path, REC_TABLE_FILE))
+    compiled = compiled or {}
+    for name, model in compiled.items():
+        save_compiled(os.path.join(tmp_path, COMPILED_FILES[name]), model)
+
+    digest = hashlib.sha256()
+    for name in [RANKER_FILE, REC_MODEL_FILE, REC_TABLE_FILE] + [COMPILED_FILES[name] for name in sorted(compiled)]:
+        with open(os.path.join(tmp_path, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": digest.hexdigest()[:16],
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rec_features": list(rec_features),
+        "rank_features": list(rank_features),
+        "labels": [str(label) for label in mlb.classes_],
+        "training": metadata or {},
+        "compiled": sorted(compiled),
+    }
+    with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    publish_directory(tmp_path, path)
+    return manifest["version"]
+
+# -----------------------------
+# Loading
+# -----------------------------
+class ModelBundle:
+    """Trained models, each loaded on first access with its load time recorded.
+
+    The feature lists and labels come from the manifest (cheap); the ranker, the
+    recommendation table and the forest are only read when first used.
+    """
+
+    def __init__(self, version, rec_features, rank_features, labels, loaders):
+        self.version = version
+        self.rec_features = list(rec_features)
+        self.rank_features = list(rank_features)
+        if MultiLabelBinarizer is not None:
+            self.mlb = MultiLabelBinarizer(classes=list(labels)).fit([])
+        else:
+            # Serving only reads the label names
+            self.mlb = types.SimpleNamespace(classes_=np.array(list(labels), dtype=object))
+        self.load_times = {}
+        self._loaders = loaders
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self._checks = {"ranker": self._check_ranker, "rec_model": self._check_rec_model}
+
+    @classmethod
+    def open(cls, path, compiled="auto"):
+        """Open the bundle at `path`. `compiled` picks the predictors: "none" for the original
+        models, "all" for the compiled ones where the bundle has them, "auto" for the compiled
+        forest (much faster on small batches) and the native ranker unless LightGBM is missing.
+
+        The lazy loaders read from the published version `path` resolves to now, so a
+        bundle swapped in later is never mixed with this manifest.
+        """
+        path = os.path.realpath(path)
+        manifest_path = os.path.join(path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise BundleError(f"No model bundle at {path}")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != BUNDLE_FORMAT:
+            raise BundleError(f"Unsupported model bundle format {manifest.get('format')} (expected {BUNDLE_FORMAT})")
+        loaders = {
+            "ranker": lambda: lgb.Booster(model_file=os.path.join(path, RANKER_FILE)),
+            # Uncompressed, so the forest's arrays are memory-mapped rather than read
+            "rec_model": lambda: joblib.load(os.path.join(path, REC_MODEL_FILE), mmap_mode="r"),
+            "rec_table": lambda: joblib.load(os.path.join(path, REC_TABLE_FILE)),
+        }
+        use_compiled = {
+            "ranker": compiled == "all" or (compiled == "auto" and lgb is None),
+            "rec_model": compiled in ("all", "auto"),
+        }
+        for name in manifest.get("compiled", []):
+            if use_compiled[name]:
+                loaders[name] = lambda file=COMPILED_FILES[name]: load_compiled(os.path.join(path, file))
+        return cls(manifest["version"], manifest["rec_features"], manifest["rank_features"], manifest["labels"], loaders)
+
+    @classmethod
+    def from_legacy_files(cls, path="."):
+        """Models saved as the separate *.pkl files written by older training runs"""
+        def optional(name):
+            file_path = os.path.join(path, name)
+            return lambda: joblib.load(file_path) if os.path.exists(file_path) else None
+
+        return cls(
+            "legacy",
+            joblib.load(os.path.join(path, "rec_features.pkl")),
+            joblib.load(os.path.join(path, "rank_features.pkl")),
+            joblib.load(os.path.join(path, "mlb.pkl")).classes_,
+            loaders={
+                "ranker": lambda: joblib.load(os.path.join(path, "ranker.pkl")),
+                "rec_model": lambda: joblib.load(os.path.join(path, "rec_model.pkl")),
+                "rec_table": optional("rec_table.pkl"),
+            }
+        )
+
+    def _get(self, name):
+        if name not in self._loaded:
+            with self._lock:
+                if name not in self._loaded:
+                    start = time.perf_counter()
+                    try:
+                        model = self._loaders[name]()
+                    except FileNotFoundError as e:
+                        raise BundleError(f"Model bundle {self.version} was removed before its {name} was loaded") from e
+                    self.load_times[name] = time.perf_counter() - start
+                    if name in self._checks:
+                        self._checks[name](model)
+                    self._loaded[name] = model
+        return self._loaded[name]
+
+    @property
+    def ranker(self):
+        return self._get("ranker")
+
+    @property
+    def rec_model(self):
+        return self._get("rec_model")
+
+    @property
+    def rec_table(self):
+        return self._get("rec_table")
+
+    # Schema checks, run when a model is loaded. Without them a renamed or reordered
+    # feature would silently be filled with zeros by the feature reindexing.
+    def _check_ranker(self, ranker):
+        ranker_features = list(ranker.feature_name())
+        if ranker_features != self.rank_features:
+            raise BundleError(f"Ranker was trained on {ranker_features}, bundle lists {self.rank_features}")
+
+    def _check_rec_model(self, rec_model):
+        if rec_model.n_features_in_ != len(self.rec_features):
+            raise BundleError(
+                f"Recommendation model expects {rec_model.n_features_in_} features, bundle lists {len(self.rec_features)}"
+            )
+        if rec_model.n_outputs_ != len(self.mlb.classes_):
+            raise BundleError(
+                f"Recommendation model has {rec_model.n_outputs_} outputs, bundle lists {len(self.mlb.classes_)} labels"
+            )
+
+    def validate(self):
+        """Load the ranker now so a feature mismatch fails at startup rather than on a request"""
+        self.ranker
+        return self
+
+    def timing_report(self):
+        return ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.load_times.items())
+
+def load_models(bundle_path, legacy_path=".", compiled="auto", allow_legacy=True):
+    """Open the model bundle at `bundle_path`, falling back to the legacy *.pkl files when
+    there is no bundle at all and `allow_legacy` (a process serving a bundle passes False)"""
+    start = time.perf_counter()
+    if os.path.lexists(bundle_path) or not allow_legacy:
+        models = ModelBundle.open(bundle_path, compiled=compiled)
+    else:
+        logger.warning("No model bundle at %s, loading legacy model files from %s", bundle_path, legacy_path)
+        models = ModelBundle.from_legacy_files(legacy_path)
+    models.load_times["manifest"] = time.perf_counter() - start
+    return models
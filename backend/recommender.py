@@ -0,0 +1,73 @@
+import itertools
+import numpy as np
+import pandas as pd
+from aggregation import STATUS_COLUMNS
+
+def encode_statuses(df, rec_features):
+    """One-hot encode the status columns of `df` straight into the `rec_features` layout.
+
+    Equivalent to `pd.get_dummies(df[STATUS_COLUMNS]).reindex(columns=rec_features, fill_value=0)`
+    but done once for the whole frame: each column is factorized and only its distinct values
+    are looked up, so unseen statuses simply leave their row all-zero like the reindex did.
+    """
+    index = {name: i for i, name in enumerate(rec_features)}
+    X = np.zeros((len(df), len(rec_features)), dtype=np.uint8)
+    rows = np.arange(len(df))
+    for col in STATUS_COLUMNS:
+        codes, uniques = pd.factorize(df[col])
+        positions = np.array([index.get(f"{col}_{value}", -1) for value in uniques] + [-1])[codes]
+        known = positions >= 0
+        X[rows[known], positions[known]] = 1
+    return pd.DataFrame(X.astype(bool), columns=rec_features)
+
+def predict_model_recommendations(df, rec_model, mlb, rec_features):
+    """Raw model output for every resource row of `df` with a single model call.
+
+    Returns one list of recommendations per row, in row order; rows the model
+    has nothing for are left empty.
+    """
+    if len(df) == 0:
+        return []
+    pred = np.asarray(rec_model.predict(encode_statuses(df, rec_features)))
+    rows, cols = np.nonzero(pred)
+    counts = np.bincount(rows, minlength=len(df))
+    return [labels.tolist() for labels in np.split(mlb.classes_[cols], np.cumsum(counts)[:-1])]
+
+def apply_fallback(df, recs, fallback):
+    """Fill the empty entries of `recs` with `fallback(rows_df)`, called once for all of them"""
+    empty = [i for i, r in enumerate(recs) if not r]
+    if empty:
+        for i, fallback_recs in zip(empty, fallback(df.iloc[empty])):
+            recs[i] = fallback_recs
+    return recs
+
+# -----------------------------
+# Status-combination lookup table
+# -----------------------------
+def build_recommendation_table(rec_model, mlb, rec_features, status_values):
+    """Precompute the model output for every combination of known statuses.
+
+    The recommendation model only sees the four statuses, so its output is fully
+    determined by the (Connectivity, Update, Alerts, Security) tuple. `status_values`
+    maps each status column to its known values.
+    """
+    combos = list(itertools.product(*(status_values[col] for col in STATUS_COLUMNS)))
+    df = pd.DataFrame(combos, columns=STATUS_COLUMNS)
+    return dict(zip(combos, predict_model_recommendations(df, rec_model, mlb, rec_features)))
+
+def lookup_recommendations(df, table, live_predict, stats=None):
+    """Model output for every resource row of `df` read from `table`.
+
+    Status tuples missing from the table are predicted together with
+    `live_predict(rows_df)` and memoized into the table. A `stats` dict
+    receives the number of rows found in the table ("hits") and not ("misses").
+    """
+    keys = list(df[STATUS_COLUMNS].itertuples(index=False, name=None))
+    hits = [key in table for key in keys]
+    missing = list(dict.fromkeys(key for key, hit in zip(keys, hits) if not hit))
+    if stats is not None:
+        stats["hits"] = sum(hits)
+        stats["misses"] = len(keys) - stats["hits"]
+    if missing:
+        table.update(zip(missing, live_predict(pd.DataFrame(missing, columns=STATUS_COLUMNS))))
+    return [list(table[key]) for key in keys]
@@ -0,0 +1,60 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+def file_signature(path):
+    """(mtime, size) of `path`, or None when it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+class FileWatcher:
+    """Polls a set of files and calls `on_change(changed_paths)` from a daemon thread
+    whenever any of their signatures changes.
+
+    The callback runs on the watcher thread, so slow reloads never block requests;
+    exceptions are logged and the watcher keeps going.
+    """
+
+    def __init__(self, paths, on_change, interval=5.0):
+        self.paths = list(paths)
+        self.on_change = on_change
+        self.interval = interval
+        self.signatures = {path: file_signature(path) for path in self.paths}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None and self.interval > 0:
+            self.thread = threading.Thread(target=self._run, name="telemetry-model-watcher", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def poll(self):
+        """Check the files once, calling `on_change` when some changed. Returns the changed paths.
+
+        The new signatures are recorded even when `on_change` raises, so a bad file is
+        reported once rather than on every poll; it is retried when it changes again.
+        """
+        signatures = {path: file_signature(path) for path in self.paths}
+        changed = [path for path in self.paths if signatures[path] != self.signatures[path]]
+        self.signatures = signatures
+        if changed:
+            self.on_change(changed)
+        return changed
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Reloading after a file change failed")
@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import Mapping
+from datetime import datetime, timezone
+
+import numpy as np
+
+from aggregation import STATUS_COLUMNS, ResourceTable, flatten_sites
+from exporter import publish_directory
+
+TABLE_FORMAT = 1
+META = "meta.json"
+
+# -----------------------------
+# String columns
+# -----------------------------
+class StringColumn:
+    """Strings stored as one UTF-8 byte buffer plus offsets (both memory-mappable).
+
+    Indexing decodes only the requested strings, so a column nobody reads costs no memory.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [str(s).encode() for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.data[self.offsets[key]:self.offsets[key + 1]].tobytes().decode()
+        positions = np.arange(len(self))[key]
+        if len(positions) == 0:
+            return np.empty(0, dtype=object)
+        # Decode from one contiguous copy of the spanned bytes instead of per-string slices
+        starts, ends = self.offsets[positions], self.offsets[positions + 1]
+        base = int(starts.min())
+        buffer = self.data[base:int(ends.max())].tobytes()
+        values = np.empty(len(positions), dtype=object)
+        for i, (start, end) in enumerate(zip((starts - base).tolist(), (ends - base).tolist())):
+            values[i] = buffer[start:end].decode()
+        return values
+
+    def to_array(self):
+        return self[:]
+
+# -----------------------------
+# Writing
+# -----------------------------
+def code_dtype(n_categories):
+    return np.int8 if n_categories <= 127 else np.int16 if n_categories <= 32767 else np.int32
+
+def save_table(table, path):
+    """Write a ResourceTable as a directory of .npy columns plus a meta.json with the categories.
+
+    The table is assembled in a temp directory and published with
+    `exporter.publish_directory`, and meta.json records a content hash used as the
+    data version. Returns that version.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    site_names = StringColumn.from_strings(table.site_names)
+    resource_names = (
+        table.resource_names if isinstance(table.resource_names, StringColumn)
+        else StringColumn.from_strings(table.resource_names)
+    )
+    columns = {
+        "site_codes": np.asarray(table.site_codes, dtype=np.int32),
+        "type_codes": np.asarray(table.type_codes, dtype=code_dtype(len(table.type_names))),
+        "site_names": site_names.data,
+        "site_name_offsets": site_names.offsets,
+        "resource_names": resource_names.data,
+        "resource_name_offsets": resource_names.offsets,
+    }
+    for col in STATUS_COLUMNS:
+        columns[f"status_{col}"] = np.asarray(table.status_codes[col], dtype=code_dtype(len(table.status_names[col])))
+
+    digest = hashlib.sha256()
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(values))
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(values).tobytes())
+    meta = {
+        "format": TABLE_FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rows": len(table),
+        "sites": len(table.site_names),
+        "type_names": [str(t) for t in table.type_names],
+        "status_names": {col: [str(s) for s in table.status_names[col]] for col in STATUS_COLUMNS},
+    }
+    digest.update(json.dumps(meta["type_names"] + [meta["status_names"]], sort_keys=True).encode())
+    meta["version"] = digest.hexdigest()[:16]
+    with open(os.path.join(tmp_path, META), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    publish_directory(tmp_path, path)
+    return meta["version"]
+
+# -----------------------------
+# Loading
+# -----------------------------
+def table_exists(path):
+    """Whether telemetry is stored as a table at `path`. A table directory without its
+    meta.json still counts (`load_table` then fails) rather than the JSON being read instead."""
+    return os.path.lexists(path)
+
+def load_table(path, mmap=True):
+    """Open a table written by `save_table`, returning (ResourceTable, data version).
+
+    With `mmap` the code columns are memory-mapped, so only the pages actually read
+    are loaded. Site names are decoded up front (every ranking needs them); resource
+    names stay encoded until indexed.
+    """
+    # All columns from the same published version, even if another one is swapped in meanwhile
+    path = os.path.realpath(path)
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    if meta.get("format") != TABLE_FORMAT:
+        raise ValueError(f"Unsupported resource table format {meta.get('format')} at {path} (expected {TABLE_FORMAT})")
+
+    def column(name):
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+
+    table = ResourceTable(
+        site_names=StringColumn(column("site_names"), column("site_name_offsets")).to_array(),
+        site_codes=column("site_codes"),
+        resource_names=StringColumn(column("resource_names"), column("resource_name_offsets")),
+        type_names=np.array(meta["type_names"], dtype=object),
+        type_codes=column("type_codes"),
+        status_names={col: np.array(meta["status_names"][col], dtype=object) for col in STATUS_COLUMNS},
+        status_codes={col: column(f"status_{col}") for col in STATUS_COLUMNS},
+    )
+    lengths = [len(table.site_codes), len(table.resource_names), len(table.type_codes)]
+    lengths += [len(codes) for codes in table.status_codes.values()]
+    if set(lengths) != {meta["rows"]} or len(table.site_names) != meta["sites"]:
+        raise ValueError(f"Resource table at {path} is inconsistent with its {META}")
+    return table, meta["version"]
+
+class SiteResources(Mapping):
+    """Read-only {SiteName: [resource]} view of a ResourceTable in the nested JSON layout.
+
+    A site's resource dicts are only built when that site is looked up, so ranking
+    straight from the table never pays for them.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        counts = np.bincount(table.site_codes, minlength=len(table.site_names))
+        self.order = np.argsort(table.site_codes, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.positions = {name: i for i, name in enumerate(table.site_names)}
+
+    def __getitem__(self, site_name):
+        t = self.table
+        rows = self.order[self.offsets[self.positions[site_name]]:self.offsets[self.positions[site_name] + 1]]
+        names = t.resource_names[rows]
+        return [
+            {
+                "ResourceName": names[k],
+                "ResourceType": t.type_names[t.type_codes[row]],
+                **{col: {"status": t.status_names[col][t.status_codes[col][row]]} for col in STATUS_COLUMNS},
+            }
+            for k, row in enumerate(rows)
+        ]
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, site_name):
+        return site_name in self.positions
+
+    def fingerprints(self):
+        """{SiteName: fingerprint} of all sites, hashed from the columns in one vectorized pass.
+
+        Fingerprints only need to be comparable within one process (they are never
+        persisted), so Python's string hash is good enough and cheap.
+        """
+        t = self.table
+        with np.errstate(over="ignore"):
+            h = np.array([hash(name) for name in t.resource_names[:]], dtype=np.int64).view(np.uint64)
+            for names, codes in [(t.type_names, t.type_codes)] + [(t.status_names[c], t.status_codes[c]) for c in STATUS_COLUMNS]:
+                category_hashes = np.array([hash(str(name)) for name in names], dtype=np.int64).view(np.uint64)
+                h = h * np.uint64(0x100000001B3) ^ category_hashes[codes]
+            # Position within the site, so reordered resources count as a change
+            h = h[self.order]
+            position = np.arange(len(h), dtype=np.uint64) - np.repeat(self.offsets[:-1], np.diff(self.offsets)).astype(np.uint64)
+            h = (h ^ (position * np.uint64(0x9E3779B97F4A7C15))) * np.uint64(0xBF58476D1CE4E5B9)
+            site_hashes = np.add.reduceat(h, self.offsets[:-1]) if len(h) else h
+        return dict(zip(self.positions, site_hashes.tolist()))
+
+# -----------------------------
+# Conversion
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a nested sites JSON into a columnar resource table")
+    parser.add_argument("input", nargs="?", default="data/sites_clean.json")
+    parser.add_argument("output", nargs="?", default="data/sites_table")
+    args = parser.parse_args(argv)
+    with open(args.input) as f:
+        table = flatten_sites(json.load(f))
+    version = save_table(table, args.output)
+    print(f"✅ Resource table written to {args.output} ({len(table)} resources, version {version})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import numpy as np
+
+# sort parameter -> (field, descending); the default puts the least healthy sites first
+SORT_KEYS = {
+    "health": ("SiteHealthScore", False),
+    "-health": ("SiteHealthScore", True),
+    "rankscore": ("RankScore", False),
+    "-rankscore": ("RankScore", True),
+    "name": ("SiteName", False),
+    "-name": ("SiteName", True),
+}
+
+class SiteIndex:
+    """In-memory column index over ranked sites for filtered, paginated and top-K queries.
+
+    `records` maps SiteName to a dict holding at least SiteHealthScore, RankScore,
+    RankLabel (unrounded), ResourceTypes and Group.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.names = np.array(sorted(records), dtype=object)
+        self.columns = {
+            "SiteHealthScore": np.array([records[n]["SiteHealthScore"] for n in self.names], dtype=float),
+            "RankScore": np.array([records[n]["RankScore"] for n in self.names], dtype=float),
+            # names are sorted, so the position doubles as the name's sort key
+            "SiteName": np.arange(len(self.names), dtype=float),
+        }
+        self.labels = np.array([records[n]["RankLabel"] for n in self.names], dtype=int)
+        self.by_type = {}
+        for i, name in enumerate(self.names):
+            for rtype in records[name]["ResourceTypes"]:
+                self.by_type.setdefault(rtype, []).append(i)
+        self.by_type = {rtype: np.array(rows) for rtype, rows in self.by_type.items()}
+        self.by_group = {}
+        for i, name in enumerate(self.names):
+            self.by_group.setdefault(records[name]["Group"], []).append(i)
+        self.by_group = {group: np.array(rows) for group, rows in self.by_group.items()}
+
+    def updated(self, records, changed):
+        """Index over `records`, where only the sites named in `changed` differ from this
+        index's records (updated, added or removed).
+
+        Their rows are replaced in copies of the arrays, so the cost is a few array copies
+        rather than a rebuild. While no site is added or removed no row moves, and the names
+        and the lookup arrays of types and groups no changed site belongs to are shared.
+        """
+        dropped = sorted(name for name in changed if name in self.records)
+        added = sorted(name for name in changed if name in records)
+        dropped_rows = np.searchsorted(self.names, np.array(dropped, dtype=object))
+        if dropped == added:
+            # The same sites with new values: every row stays where it is
+            names, added_rows, row_map = self.names, dropped_rows, None
+
+            def column(values, field, dtype):
+                values = values.copy()
+                values[added_rows] = np.array([records[n][field] for n in added], dtype=dtype)
+                return values
+        else:
+            keep = np.ones(len(self.names), dtype=bool)
+            keep[dropped_rows] = False
+            kept_names = self.names[keep]
+            positions = np.searchsorted(kept_names, np.array(added, dtype=object))
+            names = np.insert(kept_names, positions, np.array(added, dtype=object))
+            added_rows = positions + np.arange(len(added))
+            row_map = np.full(len(self.names), -1, dtype=int)
+            row_map[keep] = np.arange(len(kept_names)) + np.searchsorted(positions, np.arange(len(kept_names)), side="right")
+
+            def column(values, field, dtype):
+                return np.insert(values[keep], positions, np.array([records[n][field] for n in added], dtype=dtype))
+
+        def lookup(rows_by_key, keys_of):
+            new_rows = {}
+            for name, row in zip(added, added_rows):
+                for key in keys_of(records[name]):
+                    new_rows.setdefault(key, []).append(row)
+            touched = {key for name in dropped for key in keys_of(self.records[name])} | set(new_rows)
+            result = {}
+            for key in set(rows_by_key) | set(new_rows):
+                rows = rows_by_key.get(key, np.array([], dtype=int))
+                if row_map is not None:
+                    rows = row_map[rows]
+                    rows = rows[rows >= 0]
+                elif key in touched:
+                    rows = np.setdiff1d(rows, dropped_rows, assume_unique=True)
+                if key in new_rows:
+                    rows = np.sort(np.concatenate([rows, new_rows[key]]).astype(int))
+                if len(rows):
+                    result[key] = rows
+            return result
+
+        index = SiteIndex.__new__(SiteIndex)
+        index.records = records
+        index.names = names
+        index.columns = {
+            "SiteHealthScore": column(self.columns["SiteHealthScore"], "SiteHealthScore", float),
+            "RankScore": column(self.columns["RankScore"], "RankScore", float),
+            "SiteName": self.columns["SiteName"] if row_map is None else np.arange(len(names), dtype=float),
+        }
+        index.labels = column(self.labels, "RankLabel", int)
+        index.by_type = lookup(self.by_type, lambda record: record["ResourceTypes"])
+        index.by_group = lookup(self.by_group, lambda record: [record["Group"]])
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def query(self, limit, offset=0, min_label=None, resource_type=None, group=None, sort="health"):
+        """Site names of the requested page and the total number of matching sites.
+
+        Only the first `offset + limit` matches are selected (np.partition) and sorted, so
+        top-K pages stay cheap regardless of fleet size. Ties are broken by SiteName.
+        """
+        field, descending = SORT_KEYS[sort]
+        if resource_type is not None:
+            rows = self.by_type.get(resource_type, np.array([], dtype=int))
+        else:
+            rows = np.arange(len(self.names))
+        if group is not None:
+            rows = np.intersect1d(rows, self.by_group.get(group, np.array([], dtype=int)))
+        if min_label is not None:
+            rows = rows[self.labels[rows] >= min_label]
+
+        keys = self.columns[field][rows]
+        if descending:
+            keys = -keys
+        k = min(offset + limit, len(rows))
+        if k == 0:
+            return [], len(rows)
+        if k < len(rows):
+            # Keep everything tied with the k-th key so the name tie-break stays stable across pages
+            kth = np.partition(keys, k - 1)[k - 1]
+            selected = np.flatnonzero(keys <= kth)
+        else:
+            selected = np.arange(len(rows))
+        # rows are in name order, so lexsort on (position, key) breaks ties by name
+        ordered = selected[np.lexsort((selected, keys[selected]))]
+        return list(self.names[rows[ordered[offset:k]]]), len(rows)
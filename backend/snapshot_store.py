@@ -0,0 +1,78 @@
+import contextlib
+import logging
+import mmap
+import os
+import re
+
+from exporter import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # without file locks (Windows) concurrent builders simply each build
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored files' layout or content for the same versions changes, so older files are never read
+STORE_FORMAT = 2
+
+class SnapshotStore:
+    """Ranking artifacts shared by the server's worker processes through a directory.
+
+    Each artifact is a file named `<key>.<name>`, where the key identifies the data and
+    model versions it was computed from. The first process to need an artifact builds
+    and writes it under an exclusive file lock; processes asking meanwhile wait for the
+    lock and then read the file instead of computing it again. Files are memory-mapped
+    read-only, so all workers share one copy in the page cache. Only the files of the
+    `keep` most recently written keys are kept.
+    """
+
+    def __init__(self, path, keep=4):
+        self.path = path
+        self.keep = keep
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, data_version, model_version):
+        return re.sub(r"[^A-Za-z0-9_-]", "_", f"v{STORE_FORMAT}-{data_version}-{model_version}")
+
+    @contextlib.contextmanager
+    def locked(self, key):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, f"{key}.lock"), "ab") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def get_or_build(self, key, name, build):
+        """The artifact as a read-only mmap and whether it was already stored, writing
+        `build()` (bytes) first when no process has yet"""
+        path = os.path.join(self.path, f"{key}.{name}")
+        found = os.path.exists(path)
+        if not found:
+            with self.locked(key):
+                found = os.path.exists(path)
+                if not found:
+                    atomic_write(path, build())
+            if not found:
+                self.prune()
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), found
+
+    def prune(self):
+        """Remove the files of all but the `keep` most recently written keys"""
+        latest = {}
+        for entry in os.scandir(self.path):
+            key = entry.name.split(".", 1)[0]
+            latest[key] = max(latest.get(key, 0), entry.stat().st_mtime)
+        stale = set(sorted(latest, key=latest.get, reverse=True)[self.keep:])
+        for entry in os.scandir(self.path):
+            if entry.name.split(".", 1)[0] in stale:
+                try:
+                    # Mapped files stay readable for the processes still using them
+                    os.remove(entry.path)
+                except OSError:
+                    logger.debug("Could not remove %s", entry.path)
@@ -0,0 +1,199 @@
+import contextlib
+import glob
+import heapq
+import os
+import threading
+import time
+from collections.abc import Mapping
+
+import orjson
+
+from aggregation import STATUS_COLUMNS
+
+try:
+    import fcntl
+except ImportError:  # without file locks (Windows) only one process may ingest telemetry
+    fcntl = None
+
+def apply_deltas(grouped, deltas):
+    """Apply resource status deltas to `grouped` ({SiteName: [resource]}) copy-on-write.
+
+    Each delta is a dict with SiteName, ResourceName, optionally ResourceType and any
+    of the status columns. `grouped` and its resource dicts are left untouched (they
+    may be shared with a snapshot that is still being served); the new resource lists
+    of the affected sites are returned as {SiteName: [resource]}.
+    Raises ValueError for a new resource without ResourceType or any of the statuses.
+    """
+    updates = {}
+    for delta in deltas:
+        site_name, resource_name = delta["SiteName"], delta["ResourceName"]
+        if site_name not in updates:
+            updates[site_name] = list(grouped.get(site_name, []))
+        resources = updates[site_name]
+
+        position = next((i for i, r in enumerate(resources) if r["ResourceName"] == resource_name), None)
+        if position is None:
+            missing = [field for field in ["ResourceType"] + STATUS_COLUMNS if not delta.get(field)]
+            if missing:
+                raise ValueError(f"New resource {site_name}/{resource_name} needs {', '.join(missing)}")
+            resource = {"ResourceName": resource_name, "ResourceType": delta["ResourceType"]}
+            resources.append(resource)
+            position = len(resources) - 1
+        else:
+            resource = dict(resources[position])
+            if delta.get("ResourceType"):
+                resource["ResourceType"] = delta["ResourceType"]
+
+        for col in STATUS_COLUMNS:
+            if delta.get(col) is not None:
+                resource[col] = {"status": delta[col]}
+        resources[position] = resource
+    return updates
+
+class UpdatedResources(Mapping):
+    """{SiteName: [resource]} view of `base` with the sites in `updates` replaced, or removed
+    where their new list is empty.
+
+    Updating a view again starts from the same `base` with the merged updates, so a stream
+    of small ingests copies only the sites updated since the base was loaded, never the
+    whole fleet (and a table-backed base is never materialized).
+    """
+
+    def __init__(self, base, updates):
+        if isinstance(base, UpdatedResources):
+            self.base, self.updates, self.size = base.base, dict(base.updates), len(base)
+        else:
+            self.base, self.updates, self.size = base, {}, len(base)
+        for name, resources in updates.items():
+            self.size += bool(resources) - (name in self)
+            self.updates[name] = resources
+
+    def __getitem__(self, site_name):
+        if site_name in self.updates:
+            if not self.updates[site_name]:
+                raise KeyError(site_name)
+            return self.updates[site_name]
+        return self.base[site_name]
+
+    def __contains__(self, site_name):
+        if site_name in self.updates:
+            return bool(self.updates[site_name])
+        return site_name in self.base
+
+    def __iter__(self):
+        for name in self.base:
+            if name not in self.updates or self.updates[name]:
+                yield name
+        for name, resources in self.updates.items():
+            if resources and name not in self.base:
+                yield name
+
+    def __len__(self):
+        return self.size
+
+def apply_deltas_to_sites(sites, delta_batches):
+    """Apply logged delta batches to the stored sites list (site records in file order).
+
+    The deltas see each site's resources merged across its records, as served. Updated
+    resources are replaced where they are stored and new ones appended to the site's
+    last record; sites not stored yet are appended. Every other record, including sites
+    without resources and any extra fields, is kept as is. Returns `sites`.
+    """
+    records = {}
+    for i, site in enumerate(sites):
+        records.setdefault(site.get("SiteName"), []).append(i)
+    for deltas in delta_batches:
+        stored = {
+            name: [resource for i in records[name] for resource in sites[i].get("Resources") or []]
+            for name in {delta["SiteName"] for delta in deltas} if name in records
+        }
+        for name, resources in apply_deltas(stored, deltas).items():
+            if name not in records:
+                records[name] = [len(sites)]
+                sites.append({"SiteName": name, "Resources": []})
+            # Deltas never remove resources, so each record keeps its share of the merged list
+            start = 0
+            for k, i in enumerate(records[name]):
+                end = len(resources) if k == len(records[name]) - 1 else start + len(sites[i].get("Resources") or [])
+                sites[i] = {**sites[i], "Resources": resources[start:end]}
+                start = end
+    return sites
+
+class TelemetryLog:
+    """Append-only NDJSON logs of the telemetry delta batches applied since the last compaction.
+
+    Each server process appends to its own file (`<path>.<pid>`), so several processes
+    sharing a data directory (`uvicorn --workers N`) never interleave or lose appends.
+    The stored telemetry plus a replay of all the logs is the current telemetry, so
+    ingesting only costs an append; `compact()` folds every process's log back into the
+    stored sites. Appends hold a lock shared across processes, compaction an exclusive one.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        # Deltas in all logs as of the last replay, plus the ones this process appended since
+        self.count = 0
+
+    @contextlib.contextmanager
+    def locked(self, exclusive=False):
+        """Hold the lock shared by all processes using these logs"""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "ab") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def log_paths(self):
+        """The logs of all processes (and a log written before they were per process)"""
+        paths = [path for path in glob.glob(f"{glob.escape(self.path)}.*") if path.rsplit(".", 1)[1].isdigit()]
+        return sorted(paths) + ([self.path] if os.path.exists(self.path) else [])
+
+    def read(self, path):
+        """(time, deltas) of the batches logged in one file, ignoring a torn last line"""
+        batches = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                    batches.append((entry["time"], entry["deltas"]))
+                except (orjson.JSONDecodeError, KeyError):
+                    continue
+        return batches
+
+    def replay(self, paths=None):
+        """The delta batches of all logs, merged in the order they were logged. Resets `count`."""
+        logs = [self.read(path) for path in (self.log_paths() if paths is None else paths)]
+        # Each log is already in order; merging keeps it so even if the clock stepped back
+        batches = [deltas for _, deltas in heapq.merge(*logs, key=lambda batch: batch[0])]
+        self.count = sum(len(deltas) for deltas in batches)
+        return batches
+
+    def append(self, deltas):
+        line = orjson.dumps({"time": time.time(), "deltas": deltas}) + b"\n"
+        with self.lock, self.locked():
+            with open(f"{self.path}.{os.getpid()}", "ab") as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.count += len(deltas)
+
+    def compact(self, save):
+        """Apply the logged deltas of all processes with `save(delta_batches)`, then remove the
+        logs. Returns what `save()` returned, or None when no process had logged anything."""
+        with self.lock, self.locked(exclusive=True):
+            paths = self.log_paths()
+            batches = self.replay(paths)
+            if not batches:
+                return None
+            result = save(batches)
+            for path in paths:
+                os.remove(path)
+            self.count = 0
+        return result
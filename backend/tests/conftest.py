@@ -0,0 +1,37 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The backend modules import each other as top-level modules
+sys.path.insert(0, BACKEND)
+
+SAMPLE_SITES = os.path.join(BACKEND, "data", "sites_clean.json")
+
+@pytest.fixture(scope="session")
+def model_bundle(tmp_path_factory):
+    """A model bundle trained on the sample telemetry"""
+    import train_recommendation
+    path = tmp_path_factory.mktemp("models") / "model_bundle"
+    train_recommendation.main([
+        "--data", SAMPLE_SITES, "--table", str(path.parent / "no_table"), "--bundle", str(path), "--no-cache"
+    ])
+    return str(path)
+
+@pytest.fixture
+def app_module(model_bundle, tmp_path, monkeypatch):
+    """app.py serving a copy of the sample telemetry from a temp working directory"""
+    os.makedirs(tmp_path / "data")
+    shutil.copy(SAMPLE_SITES, tmp_path / "data" / "sites_clean.json")
+    monkeypatch.chdir(tmp_path)
+    # Read by CPU worker processes, which import app afresh
+    monkeypatch.setenv("SITESIGHT_MODEL_BUNDLE", model_bundle)
+    monkeypatch.setenv("SITESIGHT_RELOAD_INTERVAL", "0")
+    import app
+    from telemetry_store import TelemetryLog
+    monkeypatch.setattr(app, "MODEL_BUNDLE_PATH", model_bundle)
+    monkeypatch.setattr(app, "snapshot", None)
+    monkeypatch.setattr(app, "telemetry_log", TelemetryLog(app.TELEMETRY_LOG_PATH))
+    return app
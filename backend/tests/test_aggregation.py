@@ -0,0 +1,101 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import SCORE_COLUMNS, STATUS_COLUMNS, aggregate_sites, flatten_sites
+from catalog import score_maps
+
+TYPES = ["microsoft.hybridcompute/machines", "microsoft.kubernetes/connectedclusters", "microsoft.azurestackhci/clusters"]
+
+def legacy_site_frame(sites):
+    """The per-site pandas groupby / .mode()[0] / Type_* aggregation aggregate_sites replaced"""
+    rows = []
+    for site in sites:
+        for resource in site.get("Resources", []):
+            row = {"SiteName": site["SiteName"], "ResourceType": resource["ResourceType"]}
+            for col, score_col in zip(STATUS_COLUMNS, SCORE_COLUMNS):
+                row[col] = resource[col]["status"]
+                row[score_col] = score_maps[col].get(row[col], 0)
+            rows.append(row)
+    df = pd.DataFrame(rows)
+    site_df = df.groupby("SiteName").agg(
+        {**{score_col: "mean" for score_col in SCORE_COLUMNS}, "ResourceType": lambda x: list(x)}
+    ).reset_index()
+    site_df["SiteHealthScore"] = site_df[SCORE_COLUMNS].mean(axis=1)
+    site_df["RankLabel"] = site_df["SiteHealthScore"].apply(
+        lambda score: 3 if score < 0.5 else 2 if score < 0.7 else 1 if score < 0.85 else 0
+    )
+    for t in sorted({t for types in site_df["ResourceType"] for t in types}):
+        site_df[f"Type_{t}"] = site_df["ResourceType"].apply(lambda x: 1 if t in x else 0)
+    modes = {
+        col: [df.loc[df["SiteName"] == name, col].mode()[0] for name in site_df["SiteName"]]
+        for col in STATUS_COLUMNS
+    }
+    return site_df.drop(columns="ResourceType"), modes
+
+def make_resource(name, statuses, resource_type=TYPES[0]):
+    return {"ResourceName": name, "ResourceType": resource_type,
+            **{col: {"status": status} for col, status in zip(STATUS_COLUMNS, statuses)}}
+
+def random_sites(seed, n_sites=200):
+    rng = random.Random(seed)
+    sites = []
+    for i in range(n_sites):
+        resources = [
+            make_resource(f"site-{i}-{j}", [rng.choice(list(score_maps[col])) for col in STATUS_COLUMNS], rng.choice(TYPES))
+            for j in range(rng.randint(0, 6))
+        ]
+        sites.append({"SiteName": f"site-{rng.randint(0, n_sites):04d}", "Resources": resources})
+    return sites
+
+# Sites whose health lands exactly on the label cut-offs, and status ties between resources
+EDGE_SITES = [
+    # every score 0.5 -> health 0.5
+    {"SiteName": "at-0.50", "Resources": [make_resource("a", ["NeedsAttention", "NeedsAttention", "NeedsAttention", "NonCompliant"])]},
+    # 1.0 + 0.8 + 0.5 + 0.5 -> health 0.7
+    {"SiteName": "at-0.70", "Resources": [
+        make_resource(f"b{j}", ["Connected", update, "NeedsAttention", "NonCompliant"])
+        for j, update in enumerate(["UptoDate"] * 3 + ["UpdateAvailable"] * 2)
+    ]},
+    # 1.0 + 1.0 + 0.9 + 0.5 -> health 0.85
+    {"SiteName": "at-0.85", "Resources": [
+        make_resource(f"c{j}", ["Connected", "UptoDate", alerts, "NonCompliant"])
+        for j, alerts in enumerate(["NoAlerts"] * 4 + ["NeedsAttention"])
+    ]},
+    # two-way status ties in every column, four-way in Update
+    {"SiteName": "ties", "Resources": [
+        make_resource("d0", ["NotRecentlyConnected", "UpdateInProgress", "NoAlerts", "NonCompliant"], TYPES[1]),
+        make_resource("d1", ["Connected", "Unknown", "NeedsAttention", "Compliant"], TYPES[2]),
+        make_resource("d2", ["NotRecentlyConnected", "NeedsAttention", "NoAlerts", "Compliant"]),
+        make_resource("d3", ["Connected", "UpdateAvailable", "NeedsAttention", "NonCompliant"]),
+    ]},
+    {"SiteName": "no-resources", "Resources": []},
+]
+
+def assert_matches_legacy(sites):
+    expected, expected_modes = legacy_site_frame(sites)
+    agg = aggregate_sites(flatten_sites(sites), score_maps)
+    actual = agg.to_frame()
+    pd.testing.assert_frame_equal(
+        actual.drop(columns="RankLabel"), expected.drop(columns="RankLabel"), check_dtype=False
+    )
+    np.testing.assert_array_equal(actual["RankLabel"], expected["RankLabel"])
+    for col in STATUS_COLUMNS:
+        assert [agg.mode(col, i) for i in range(len(agg))] == expected_modes[col], col
+    return actual
+
+def test_edge_cases_match_legacy():
+    actual = assert_matches_legacy(EDGE_SITES).set_index("SiteName")
+    assert "no-resources" not in actual.index
+    assert actual.loc[["at-0.50", "at-0.70", "at-0.85"], "SiteHealthScore"].tolist() == [0.5, 0.7, 0.85]
+    assert actual.loc[["at-0.50", "at-0.70", "at-0.85"], "RankLabel"].tolist() == [2, 1, 0]
+
+def test_status_ties_break_to_the_first_status():
+    agg = aggregate_sites(flatten_sites(EDGE_SITES[3:4]), score_maps)
+    assert [agg.mode(col, 0) for col in STATUS_COLUMNS] == ["Connected", "NeedsAttention", "NeedsAttention", "Compliant"]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_fleets_match_legacy(seed):
+    assert_matches_legacy(random_sites(seed))
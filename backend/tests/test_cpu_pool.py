@@ -0,0 +1,33 @@
+import os
+import signal
+import time
+
+def test_killed_worker_falls_back_in_process_and_restarts_pool(app_module, monkeypatch):
+    app = app_module
+    expected = app.current_snapshot().full_payload()[0]
+
+    monkeypatch.setattr(app, "CPU_WORKERS", 2)
+    monkeypatch.setattr(app, "CPU_POOL_MIN_SITES", 1)
+    monkeypatch.setattr(app, "cpu_pool", None)
+    pool = app.get_cpu_pool()
+    try:
+        pool.submit(os.getpid).result()
+        os.kill(next(iter(pool._processes)), signal.SIGKILL)
+        # Wait until the pool has noticed and is broken
+        deadline = time.monotonic() + 30
+        while not pool._broken and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        served = app.RankingSnapshot(
+            app.snapshot.models, app.snapshot.rec_table, app.snapshot.grouped, app.snapshot.data_version
+        )
+        body, _ = served.full_payload()
+        assert bytes(body) == bytes(expected)
+
+        new_pool = app.get_cpu_pool()
+        assert new_pool is not pool
+        assert new_pool.submit(os.getpid).result() != os.getpid()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if app.cpu_pool is not None:
+            app.cpu_pool.shutdown()
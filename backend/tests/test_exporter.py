@@ -0,0 +1,13 @@
+import logging
+
+import exporter
+from exporter import ExportWriter
+
+def test_brotli_without_the_package_warns(monkeypatch, caplog, tmp_path):
+    monkeypatch.setattr(exporter, "brotli", None)
+    with caplog.at_level(logging.WARNING, logger="exporter"):
+        writer = ExportWriter([str(tmp_path / "ranked_sites.json")], compress=["gzip", "br"])
+    assert "brotli is not installed" in caplog.text
+    assert writer.compress == {"gzip"}
+    writer._write_variants(b"[]")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ranked_sites.json", "ranked_sites.json.gz"]
@@ -0,0 +1,32 @@
+import random
+
+import pandas as pd
+import pytest
+
+from generate_data import FleetGenerator
+
+TYPES = ["microsoft.hybridcompute/machines", "microsoft.kubernetes/connectedclusters", "microsoft.azurestackhci/clusters"]
+
+def make_csv(n_sites, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_sites):
+        types = rng.sample(TYPES, rng.randint(1, len(TYPES)))
+        rows.append({"Name": f" site-{i:04d} ", "ResourceTypeCount": str({t: rng.randint(1, 5) for t in types})})
+    # a few repeated source sites, which must not get new copies or duplicate types
+    rows += [dict(rows[rng.randrange(n_sites)]) for _ in range(n_sites // 10)]
+    return pd.DataFrame(rows)
+
+def generate(df, chunksize, **kwargs):
+    generator = FleetGenerator(**kwargs)
+    for start in range(0, len(df), chunksize):
+        generator.add_chunk(df.iloc[start:start + chunksize])
+    return list(generator.iter_sites())
+
+@pytest.mark.parametrize("scale", [0.4, 1.0, 2.5])
+def test_seeded_fleet_does_not_depend_on_chunksize(scale):
+    df = make_csv(300)
+    expected = generate(df, len(df), scale=scale, seed=3)
+    for chunksize in (1, 7, 50):
+        assert generate(df, chunksize, scale=scale, seed=3) == expected
+    assert generate(df, 50, scale=scale, seed=4) != expected
@@ -0,0 +1,71 @@
+import random
+
+import numpy as np
+import pytest
+
+from site_index import SORT_KEYS, SiteIndex
+
+TYPES = ["machines", "clusters", "storage"]
+
+def make_record(rng):
+    types = sorted(rng.sample(TYPES, rng.randint(1, len(TYPES))))
+    return {
+        "SiteHealthScore": round(rng.random(), 2),
+        "RankScore": rng.gauss(0, 1),
+        "RankLabel": rng.randint(0, 3),
+        "ResourceTypes": types,
+        "Group": "+".join(types),
+    }
+
+def assert_same_index(actual, expected):
+    assert list(actual.names) == list(expected.names)
+    for field, values in expected.columns.items():
+        np.testing.assert_array_equal(actual.columns[field], values)
+    np.testing.assert_array_equal(actual.labels, expected.labels)
+    for lookup in ("by_type", "by_group"):
+        actual_rows, expected_rows = getattr(actual, lookup), getattr(expected, lookup)
+        assert set(actual_rows) == set(expected_rows)
+        for key, rows in expected_rows.items():
+            np.testing.assert_array_equal(actual_rows[key], rows)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_updated_matches_rebuild(seed):
+    rng = random.Random(seed)
+    records = {f"site-{i:03d}": make_record(rng) for i in range(200)}
+    index = SiteIndex(records)
+    for _ in range(20):
+        records = dict(records)
+        changed = set(rng.sample(sorted(records), rng.randint(0, 5)))
+        changed |= {f"site-{rng.randint(0, 400):03d}" for _ in range(rng.randint(0, 3))}
+        for name in changed:
+            if name in records and rng.random() < 0.3:
+                del records[name]
+            else:
+                records[name] = make_record(rng)
+        index = index.updated(records, changed)
+        assert_same_index(index, SiteIndex(records))
+
+def test_updated_status_change_keeps_rows():
+    rng = random.Random(0)
+    records = {f"site-{i:03d}": make_record(rng) for i in range(50)}
+    index = SiteIndex(records)
+    records = {**records, "site-007": {**records["site-007"], "SiteHealthScore": 0.0}}
+    updated = index.updated(records, {"site-007"})
+    assert updated.query(1) == (["site-007"], 50)
+    # Lookups of types and groups the site doesn't belong to are shared, not copied
+    untouched = set(TYPES) - set(records["site-007"]["ResourceTypes"])
+    assert all(updated.by_type[key] is index.by_type[key] for key in untouched)
+
+def test_updated_queries_match():
+    rng = random.Random(3)
+    records = {f"site-{i:03d}": make_record(rng) for i in range(100)}
+    index = SiteIndex(records)
+    records = dict(records)
+    del records["site-010"]
+    records["site-500"] = make_record(rng)
+    updated, rebuilt = index.updated(records, {"site-010", "site-500"}), SiteIndex(records)
+    for sort in SORT_KEYS:
+        for resource_type in [None] + TYPES:
+            assert updated.query(20, 5, resource_type=resource_type, sort=sort) == rebuilt.query(
+                20, 5, resource_type=resource_type, sort=sort
+            )
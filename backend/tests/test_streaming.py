@@ -0,0 +1,16 @@
+import json
+
+import orjson
+from fastapi.testclient import TestClient
+
+def test_streamed_ranking_does_not_cache_recommendations(app_module):
+    client = TestClient(app_module.app)
+    response = client.get("/?format=ndjson")
+    assert response.status_code == 200
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    snapshot = app_module.current_snapshot()
+    assert not any(recs is not None for recs in snapshot.recommendations.values())
+
+    body, _ = snapshot.full_payload()
+    assert streamed == orjson.loads(body)
+    assert sum(recs is not None for recs in snapshot.recommendations.values()) == len(streamed)
@@ -0,0 +1,181 @@
+import copy
+import os
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from telemetry_store import TelemetryLog, UpdatedResources, apply_deltas, apply_deltas_to_sites
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "INGEST_TOKEN", "secret")
+    return TestClient(app_module.app)
+
+def first_resource(app):
+    grouped = app.current_snapshot().grouped
+    name = sorted(grouped)[0]
+    return name, grouped[name][0]
+
+def test_ingestion_requires_the_token(app_module, client, monkeypatch):
+    name, resource = first_resource(app_module)
+    delta = [{"SiteName": name, "ResourceName": resource["ResourceName"], "Alerts": "NeedsAttention"}]
+    assert client.post("/telemetry", json=delta).status_code == 403
+    assert client.post("/telemetry", json=delta, headers={"X-Ingest-Token": "wrong"}).status_code == 403
+    monkeypatch.setattr(app_module, "INGEST_TOKEN", None)
+    assert client.post("/telemetry", json=delta, headers={"X-Ingest-Token": "secret"}).status_code == 404
+    assert not os.path.exists(f"{app_module.TELEMETRY_LOG_PATH}.{os.getpid()}")
+
+def test_empty_batch_is_rejected(app_module, client):
+    version = app_module.current_snapshot().data_version
+    assert client.post("/telemetry", json=[], headers={"X-Ingest-Token": "secret"}).status_code == 422
+    assert app_module.current_snapshot().data_version == version
+    assert app_module.telemetry_log.log_paths() == []
+
+def test_unscored_status_is_rejected(app_module, client):
+    name, resource = first_resource(app_module)
+    delta = [{"SiteName": name, "ResourceName": resource["ResourceName"], "Update": "Bogus"}]
+    assert client.post("/telemetry", json=delta, headers={"X-Ingest-Token": "secret"}).status_code == 422
+    new = [{"SiteName": name, "ResourceName": "new", "ResourceType": "microsoft.hybridcompute/machines", "Update": "Unknown"}]
+    response = client.post("/telemetry", json=new, headers={"X-Ingest-Token": "secret"})
+    assert response.status_code == 422 and "Connectivity" in response.json()["detail"]
+
+# -----------------------------
+# Delta application
+# -----------------------------
+def resource(name, connectivity="Connected", update="UptoDate", alerts="NoAlerts", security="Compliant",
+             resource_type="microsoft.hybridcompute/machines"):
+    return {
+        "ResourceName": name, "ResourceType": resource_type,
+        "Connectivity": {"status": connectivity}, "Update": {"status": update},
+        "Alerts": {"status": alerts}, "Security": {"status": security},
+    }
+
+def test_apply_deltas_is_copy_on_write():
+    grouped = {"a": [resource("a-1"), resource("a-2")], "b": [resource("b-1")]}
+    before = copy.deepcopy(grouped)
+    updates = apply_deltas(grouped, [
+        {"SiteName": "a", "ResourceName": "a-2", "Alerts": "NeedsAttention"},
+        {"SiteName": "a", "ResourceName": "a-2", "ResourceType": "microsoft.kubernetes/connectedclusters"},
+        {"SiteName": "c", "ResourceName": "c-1", "ResourceType": "microsoft.hybridcompute/machines",
+         "Connectivity": "NotRecentlyConnected", "Update": "Unknown", "Alerts": "NoAlerts", "Security": "NonCompliant"},
+    ])
+    assert grouped == before
+    assert set(updates) == {"a", "c"}
+    assert updates["a"][0] is grouped["a"][0]
+    assert updates["a"][1] == resource("a-2", alerts="NeedsAttention", resource_type="microsoft.kubernetes/connectedclusters")
+    assert updates["c"] == [resource("c-1", "NotRecentlyConnected", "Unknown", "NoAlerts", "NonCompliant")]
+    with pytest.raises(ValueError, match="Security"):
+        apply_deltas(grouped, [{"SiteName": "b", "ResourceName": "b-2", "ResourceType": "x",
+                                "Connectivity": "Connected", "Update": "UptoDate", "Alerts": "NoAlerts"}])
+
+def test_updated_resources_view():
+    base = {"a": [resource("a-1")], "b": [resource("b-1")]}
+    view = UpdatedResources(base, {"b": [], "c": [resource("c-1")]})
+    assert list(view) == ["a", "c"] and len(view) == 2
+    assert "b" not in view and "c" in view
+    with pytest.raises(KeyError):
+        view["b"]
+    again = UpdatedResources(view, {"b": [resource("b-2")], "c": [resource("c-2")], "d": []})
+    assert again.base is base
+    assert dict(again) == {"a": base["a"], "b": [resource("b-2")], "c": [resource("c-2")]}
+    assert len(again) == 3
+    assert dict(view) == {"a": base["a"], "c": [resource("c-1")]}
+
+def test_apply_deltas_to_sites_keeps_records():
+    sites = [
+        {"SiteName": "a", "Resources": [resource("a-1")], "Region": "west"},
+        {"SiteName": "empty", "Resources": []},
+        {"SiteName": "bare"},
+        {"SiteName": "a", "Resources": [resource("a-2")], "Region": "east"},
+    ]
+    apply_deltas_to_sites(sites, [
+        [{"SiteName": "a", "ResourceName": "a-1", "Update": "UpdateAvailable"}],
+        [{"SiteName": "a", "ResourceName": "a-3", "ResourceType": "microsoft.hybridcompute/machines",
+          "Connectivity": "Connected", "Update": "UptoDate", "Alerts": "NoAlerts", "Security": "Compliant"},
+         {"SiteName": "new", "ResourceName": "new-1", "ResourceType": "microsoft.hybridcompute/machines",
+          "Connectivity": "Connected", "Update": "UptoDate", "Alerts": "NoAlerts", "Security": "Compliant"}],
+    ])
+    assert sites == [
+        {"SiteName": "a", "Resources": [resource("a-1", update="UpdateAvailable")], "Region": "west"},
+        {"SiteName": "empty", "Resources": []},
+        {"SiteName": "bare"},
+        {"SiteName": "a", "Resources": [resource("a-2"), resource("a-3")], "Region": "east"},
+        {"SiteName": "new", "Resources": [resource("new-1")]},
+    ]
+
+# -----------------------------
+# Logs and compaction
+# -----------------------------
+def write_log(path, batches):
+    with open(path, "wb") as f:
+        for logged_at, deltas in batches:
+            f.write(orjson.dumps({"time": logged_at, "deltas": deltas}) + b"\n")
+
+def test_compaction_merges_every_process_log(tmp_path):
+    log = TelemetryLog(str(tmp_path / "telemetry.log"))
+    delta = lambda i: [{"SiteName": "a", "ResourceName": "a-1", "Alerts": str(i)}]
+    write_log(tmp_path / "telemetry.log", [(1.0, delta(1))])
+    write_log(tmp_path / "telemetry.log.100", [(2.0, delta(2)), (5.0, delta(5))])
+    write_log(tmp_path / "telemetry.log.200", [(3.0, delta(3)), (4.0, delta(4))])
+    with open(tmp_path / "telemetry.log.200", "ab") as f:
+        f.write(b'{"time": 6.0, "del')  # torn by a crash mid-append
+    assert len(log.log_paths()) == 3
+
+    saved = []
+    assert log.compact(lambda batches: saved.append(batches) or "v2") == "v2"
+    assert saved == [[delta(i) for i in range(1, 6)]]
+    assert log.log_paths() == [] and log.count == 0
+    assert log.compact(saved.append) is None and len(saved) == 1
+
+def test_ingest_compact_and_reload_keep_stored_records(app_module, client):
+    with open("data/sites_clean.json", "rb") as f:
+        sites = orjson.loads(f.read())
+    name = next(site["SiteName"] for site in sites if site.get("Resources"))
+    empty = sum(1 for site in sites if not site.get("Resources"))
+    sites[0]["Region"] = "west"
+    sites.append({"SiteName": name, "Resources": [], "Note": "second record"})
+    with open("data/sites_clean.json", "wb") as f:
+        f.write(orjson.dumps(sites))
+
+    resource_name = app_module.current_snapshot().grouped[name][0]["ResourceName"]
+    batches = [
+        [{"SiteName": name, "ResourceName": resource_name, "Security": "NonCompliant"}],
+        [{"SiteName": name, "ResourceName": "added", "ResourceType": "microsoft.kubernetes/connectedclusters",
+          "Connectivity": "NeedsAttention", "Update": "Unknown", "Alerts": "NeedsAttention", "Security": "Compliant"}],
+    ]
+    for deltas in batches:
+        assert client.post("/telemetry", json=deltas, headers={"X-Ingest-Token": "secret"}).status_code == 200
+    served = app_module.current_snapshot()
+    assert served.data_version.endswith("+2")
+
+    app_module.compact_telemetry()
+    assert app_module.telemetry_log.log_paths() == []
+    with open("data/sites_clean.json", "rb") as f:
+        stored = orjson.loads(f.read())
+    assert stored == apply_deltas_to_sites(sites, batches)
+    assert stored[0]["Region"] == "west" and stored[-1]["Note"] == "second record"
+    assert sum(1 for site in stored if not site.get("Resources")) == empty
+    assert stored[-1]["Resources"][-1]["ResourceName"] == "added"
+
+    reloaded = app_module.current_snapshot()
+    assert "+" not in reloaded.data_version
+    assert dict(reloaded.grouped) == dict(served.grouped)
+    assert reloaded.index.records == served.index.records
+
+def test_incremental_ranking_matches_fresh_build(app_module, client):
+    grouped = app_module.current_snapshot().grouped
+    names = sorted(grouped)[:20]
+    for i, name in enumerate(names):
+        deltas = [{"SiteName": name, "ResourceName": grouped[name][0]["ResourceName"],
+                   "Connectivity": ["Connected", "NeedsAttention", "NotRecentlyConnected"][i % 3],
+                   "Update": ["UpdateAvailable", "Unknown"][i % 2]}]
+        assert client.post("/telemetry", json=deltas, headers={"X-Ingest-Token": "secret"}).status_code == 200
+    served = app_module.current_snapshot()
+
+    grouped, data_version = app_module.load_telemetry()
+    fresh = app_module.RankingSnapshot(served.models, served.rec_table, grouped, data_version)
+    assert fresh.data_version == served.data_version
+    assert fresh.index.records == served.index.records
+    assert list(fresh.index.names) == list(served.index.names)
+    assert fresh.full_payload()[0] == served.full_payload()[0]
@@ -0,0 +1,68 @@
+import lightgbm as lgb
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from tree_predictor import CompiledForest, CompiledRanker, check_parity, load_compiled, save_compiled
+
+def make_features(rng, n_rows=400, n_features=5, missing=0.15):
+    X = rng.normal(size=(n_rows, n_features))
+    X[rng.random(X.shape) < missing] = np.nan
+    X[rng.random(X.shape) < missing] = 0.0
+    return X
+
+def fit_booster(X, y, **params):
+    params = dict(objective="regression", num_leaves=15, min_data_in_leaf=5, verbose=-1, **params)
+    return lgb.train(params, lgb.Dataset(X, y), num_boost_round=20)
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+@pytest.mark.parametrize("zero_as_missing", [False, True])
+def test_ranker_matches_booster(rng, zero_as_missing):
+    X = make_features(rng)
+    # Missing values carry signal, so the trees learn a side for them
+    y = np.nan_to_num(X[:, 0], nan=3.0) + (X[:, 1] == 0.0) * 2.0 + rng.normal(scale=0.1, size=len(X))
+    booster = fit_booster(X, y, zero_as_missing=zero_as_missing)
+    compiled = CompiledRanker.from_booster(booster)
+
+    X_test = make_features(rng, n_rows=300)
+    X_test[:20] = np.nan
+    X_test[20:40] = 0.0
+    assert check_parity(booster, compiled, X_test) <= 1e-9
+    assert compiled.feature_name() == booster.feature_name()
+
+def test_forest_matches_sklearn(rng):
+    X = make_features(rng)
+    Y = np.column_stack([
+        np.isnan(X[:, 0]) | (X[:, 1] > 0),
+        (np.nan_to_num(X[:, 2]) > 0.5).astype(int) + (X[:, 3] == 0.0),
+        np.zeros(len(X), dtype=int),  # an output with a single class
+    ])
+    forest = RandomForestClassifier(n_estimators=15, max_depth=6, random_state=0).fit(X, Y)
+    compiled = CompiledForest.from_forest(forest)
+
+    X_test = make_features(rng, n_rows=300)
+    X_test[:20] = np.nan
+    assert check_parity(forest, compiled, X_test, atol=0.0) == 0.0
+
+def test_saved_models_round_trip(rng, tmp_path):
+    X = make_features(rng)
+    y = np.nan_to_num(X[:, 0]) + rng.normal(scale=0.1, size=len(X))
+    booster = fit_booster(X, y)
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, np.column_stack([y > 0, y > 1]))
+
+    for original, compiled in ((booster, CompiledRanker.from_booster(booster)), (forest, CompiledForest.from_forest(forest))):
+        path = tmp_path / f"{type(compiled).__name__}.npz"
+        save_compiled(str(path), compiled)
+        check_parity(original, load_compiled(str(path)), X, atol=0.0 if original is forest else 1e-9)
+
+def test_check_parity_rejects_differences(rng):
+    X = make_features(rng)
+    y = np.nan_to_num(X[:, 0])
+    booster = fit_booster(X, y)
+    compiled = CompiledRanker.from_booster(booster)
+    compiled.leaf_value = compiled.leaf_value + 0.01
+    with pytest.raises(ValueError, match="differs"):
+        check_parity(booster, compiled, X)
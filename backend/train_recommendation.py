@@ -1,201 +1,285 @@
+import argparse
+import hashlib
 import json
-import random
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on Windows; the report then has no memory column
+    resource = None
+
+import joblib
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MultiLabelBinarizer
 from sklearn.ensemble import RandomForestClassifier
 import lightgbm as lgb
-import joblib
+from aggregation import SCORE_COLUMNS, STATUS_COLUMNS, aggregate_sites, flatten_sites, site_cohorts
+from catalog import rule_based_recommendations_batch, score_maps
+from model_bundle import save_bundle
+from recommender import build_recommendation_table
+from resource_store import META as TABLE_META, load_table, table_exists
+from tree_predictor import CompiledForest, CompiledRanker, check_parity
 
 # -----------------------------
-# Load sites JSON
+# Pipeline stages
 # -----------------------------
-with open("data/sites_clean.json") as f:
-    sites = json.load(f)
+# Bump when a cached stage's output changes for the same input, to invalidate old cache entries
+CACHE_VERSION = 1
 
-# -----------------------------
-# Weights and mappings
-# -----------------------------
-weights = {"Connectivity": 0.3, "Update": 0.3, "Alerts": 0.2, "Security": 0.2}
-connectivity_map = {"Connected": 1, "NeedsAttention": 0.5, "NotRecentlyConnected": 0}
-update_map = {"UptoDate": 1, "UpdateAvailable": 0.5, "NeedsAttention": 0.5, "Unknown": 0, "UpdateInProgress": 0.5}
-alert_map = {"NoAlerts": 1, "NeedsAttention": 0.5}
-security_map = {"Compliant": 1, "NonCompliant": 0.5}
-
-recommendations = {
-    "Connectivity": [
-        "Check site network/firewall",
-        "Verify DNS resolution",
-        "Inspect router/switch logs",
-        "Check ISP/service provider status",
-        "Run ping and traceroute diagnostics",
-        "Test bandwidth and latency",
-        "Validate VPN or private link tunnels",
-        "Check DHCP/Static IP configuration",
-        "Review load balancer health",
-        "Examine physical cabling/ports",
-        "Monitor packet loss and jitter",
-        "Audit QoS or traffic shaping policies",
-        "Verify SSL/TLS handshake for secure connections",
-        "Confirm routing table consistency",
-        "Check wireless interference (if Wi-Fi dependent)"
-    ],
-    "Update": [
-        "Check for recent update availability",
-        "Verify if update download failed",
-        "Check permissions for update installation",
-        "Confirm device has sufficient disk space",
-        "Validate system date/time (NTP sync)",
-        "Review update installation logs",
-        "Restart services post-update if required",
-        "Ensure rollback/recovery points are set",
-        "Check dependency patches or prerequisites",
-        "Cross-check update version compatibility",
-        "Audit devices with pending reboots",
-        "Review group policy or WSUS configurations",
-        "Check update throttling or bandwidth caps",
-        "Ensure security patches applied before deadlines",
-        "Test update in staging before full rollout"
-    ],
-    "Alerts": [
-        "Review alert logs for recurring issues",
-        "Classify alerts by severity",
-        "Escalate high-priority alerts",
-        "Set alert suppression for false positives",
-        "Define auto-remediation playbooks",
-        "Tag alerts with responsible owners",
-        "Check alert thresholds and fine-tune",
-        "Validate alert integration with ticketing system",
-        "Review alert correlation across systems",
-        "Verify escalation paths for after-hours",
-        "Archive and report historical alerts",
-        "Perform RCA (Root Cause Analysis) on repeated alerts",
-        "Ensure monitoring agents are healthy",
-        "Simulate incident scenarios for alert validation",
-        "Audit alert notifications (email/SMS/webhook)"
-    ],
-    "Security": [
-        "Check patch compliance",
-        "Validate access control policies",
-        "Run vulnerability scan",
-        "Verify antivirus/EDR signatures updated",
-        "Confirm encryption at rest and in transit",
-        "Audit expired or weak TLS certificates",
-        "Check multi-factor authentication enforcement",
-        "Review firewall/NSG rules",
-        "Audit privileged account usage",
-        "Ensure least privilege principle applied",
-        "Check endpoint hardening (disable unused ports)",
-        "Run penetration test in staging environment",
-        "Review SIEM dashboards for anomalies",
-        "Verify data backup encryption",
-        "Check compliance with GDPR/ISO/NIST/PCI standards"
-    ]
-}
+def load_telemetry(data_path, table_path):
+    """The telemetry as a ResourceTable: the columnar table when present, else the sites JSON"""
+    if table_exists(table_path):
+        return load_table(table_path)[0]
+    with open(data_path) as f:
+        return flatten_sites(json.load(f))
 
-# -----------------------------
-# Helpers
-# -----------------------------
-def calculate_resource_score(resource):
-    return (
-        connectivity_map.get(resource["Connectivity"]["status"], 0) * weights["Connectivity"] +
-        update_map.get(resource["Update"]["status"], 0) * weights["Update"] +
-        alert_map.get(resource["Alerts"]["status"], 0) * weights["Alerts"] +
-        security_map.get(resource["Security"]["status"], 0) * weights["Security"]
+def input_version(data_path, table_path):
+    """Content hash of the training input, read without loading it (the table records its own)"""
+    if table_exists(table_path):
+        with open(os.path.join(table_path, TABLE_META)) as f:
+            return "table-" + json.load(f)["version"]
+    digest = hashlib.sha1()
+    with open(data_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return "json-" + digest.hexdigest()[:16]
+
+def build_rec_dataset(table, seed, rule_labels="seeded"):
+    """Recommendation model inputs: one-hot statuses X and the rule-based label matrix y, drawn
+    at random with `seed` ("seeded") or picked from the statuses alone ("deterministic")"""
+    df = table.to_frame()
+    rng = np.random.default_rng(seed) if rule_labels == "seeded" else None
+    labels = rule_based_recommendations_batch(df, rng)
+    X = pd.get_dummies(df[STATUS_COLUMNS])
+    mlb = MultiLabelBinarizer()
+    y = mlb.fit_transform(labels)
+    return {"X": X, "y": y, "mlb": mlb}
+
+def query_groups(cohorts, max_group_size, rng):
+    """Split sites into LambdaMART query groups: one per cohort, large cohorts cut into
+    random groups of at most `max_group_size` sites. Returns a list of row index arrays."""
+    groups = []
+    for cohort in sorted(set(cohorts)):
+        members = rng.permutation(np.flatnonzero(cohorts == cohort))
+        n_parts = max(1, -(-len(members) // max_group_size)) if max_group_size else 1
+        groups.extend(np.array_split(members, n_parts))
+    return groups
+
+def build_rank_dataset(table, group_by, max_group_size, holdout, seed):
+    """Ranking model inputs: per-site score means and Type_* flags, RankLabel as relevance,
+    rows ordered by query group and split by group into a training and a held-out part"""
+    agg = aggregate_sites(table, score_maps)
+    site_df = agg.to_frame()
+    feature_cols = SCORE_COLUMNS + [f"Type_{t}" for t in table.type_names]
+
+    rng = np.random.default_rng(seed)
+    cohorts = site_cohorts(agg) if group_by == "cohort" else np.full(len(site_df), "all", dtype=object)
+    groups = query_groups(cohorts, max_group_size, rng)
+    # Hold out whole groups (about `holdout` of the sites), keeping at least one for training
+    held_out = set()
+    if holdout > 0 and len(groups) > 1:
+        held_sites = 0
+        for g in rng.permutation(len(groups)):
+            if held_sites >= holdout * len(site_df) or len(held_out) == len(groups) - 1:
+                break
+            held_out.add(int(g))
+            held_sites += len(groups[g])
+
+    def part(ids):
+        rows = np.concatenate([groups[g] for g in ids]) if ids else np.array([], dtype=int)
+        return {
+            "X": site_df[feature_cols].iloc[rows].reset_index(drop=True),
+            "y": site_df["RankLabel"].iloc[rows].reset_index(drop=True),
+            "group": [len(groups[g]) for g in ids],
+        }
+
+    return {
+        "train": part([g for g in range(len(groups)) if g not in held_out]),
+        "valid": part(sorted(held_out)),
+        "feature_cols": feature_cols,
+        "cohorts": int(len(set(cohorts))),
+    }
+
+def train_rec_model(dataset, seed, n_jobs):
+    X_train, X_test, y_train, y_test = train_test_split(dataset["X"], dataset["y"], test_size=0.2, random_state=42)
+    rec_model = RandomForestClassifier(n_estimators=100, random_state=seed, n_jobs=n_jobs)
+    rec_model.fit(X_train, y_train)
+    return rec_model
+
+def train_ranker(dataset, seed, n_jobs, ndcg_at):
+    """LambdaMART over the query groups, returning (ranker, NDCG@K on the held-out groups or None)"""
+    train, valid = dataset["train"], dataset["valid"]
+    lgb_train = lgb.Dataset(train["X"], train["y"], group=train["group"])
+
+    params = {"objective": "lambdarank","metric": "ndcg","learning_rate": 0.1,"num_leaves": 31,"min_data_in_leaf": 1,
+              "eval_at": [ndcg_at], "seed": seed, "num_threads": max(n_jobs, 0), "verbose": -1}
+    evals = {}
+    valid_sets = [lgb.Dataset(valid["X"], valid["y"], group=valid["group"], reference=lgb_train)] if valid["group"] else []
+    ranker = lgb.train(
+        params, lgb_train, num_boost_round=50, valid_sets=valid_sets, valid_names=["holdout"],
+        callbacks=[lgb.record_evaluation(evals)]
     )
+    ndcg = evals["holdout"][f"ndcg@{ndcg_at}"][-1] if valid_sets else None
+    return ranker, ndcg
 
-def flatten_sites_json(sites):
-    flattened_data = []
-    for site in sites:
-        site_name = site.get("SiteName")
-        for resource in site.get("Resources", []):
-            flattened_data.append({
-                "SiteName": site_name,
-                "ResourceName": resource["ResourceName"],
-                "ResourceType": resource["ResourceType"],
-                "Connectivity": resource["Connectivity"]["status"],
-                "Update": resource["Update"]["status"],
-                "Alerts": resource["Alerts"]["status"],
-                "Security": resource["Security"]["status"],
-                "ConnectivityScore": connectivity_map.get(resource["Connectivity"]["status"], 0),
-                "UpdateScore": update_map.get(resource["Update"]["status"], 0),
-                "AlertScore": alert_map.get(resource["Alerts"]["status"], 0),
-                "SecurityScore": security_map.get(resource["Security"]["status"], 0),
-                "ResourceHealthScore": round(calculate_resource_score(resource), 2)
-            })
-    return pd.DataFrame(flattened_data)
-
-def map_health_to_label(score):
-    if score < 0.5:
-        return 3
-    elif score < 0.7:
-        return 2
-    elif score < 0.85:
-        return 1
-    else:
-        return 0
-
-def rule_based_recommendations(resource):
-    recs = []
-    if resource["Connectivity"] in ["NotRecentlyConnected", "NeedsAttention"]:
-        recs.append(random.choice(recommendations["Connectivity"]))
-    if resource["Update"] in ["NeedsAttention", "UpdateInProgress", "UpdateAvailable"]:
-        recs.append(random.choice(recommendations["Update"]))
-    if resource["Alerts"] == "NeedsAttention":
-        recs.append(random.choice(recommendations["Alerts"]))
-    if resource["Security"] == "NonCompliant":
-        recs.append(random.choice(recommendations["Security"]))
-    if not recs:
-        recs.append("No action required")
-    return recs[:3]
+def compile_models(rec_model, ranker, rec_dataset, rank_dataset):
+    """NumPy tree predictors of both models (see tree_predictor.py), each one only kept
+    when it reproduces the original model's predictions on the training inputs"""
+    X_rank = pd.concat([rank_dataset["train"]["X"], rank_dataset["valid"]["X"]]).to_numpy(dtype=float)
+    candidates = {
+        "ranker": (ranker, CompiledRanker.from_booster, X_rank),
+        "rec_model": (rec_model, CompiledForest.from_forest, rec_dataset["X"]),
+    }
+    compiled = {}
+    for name, (model, compile_model, X) in candidates.items():
+        try:
+            predictor = compile_model(model)
+            diff = check_parity(model, predictor, X)
+        except ValueError as e:
+            print(f"⚠️ Not compiling {name}: {e}")
+            continue
+        print(f"Compiled {name}: max abs difference {diff:g} over {len(X)} training rows")
+        compiled[name] = predictor
+    return compiled
 
-# -----------------------------
-# Build dataset
-# -----------------------------
-df = flatten_sites_json(sites)
-df["Recommendations"] = df[["Connectivity", "Update", "Alerts", "Security"]].apply(
-    lambda row: rule_based_recommendations(row), axis=1
-)
-
-# Recommendation Model (Random Forest)
-X = pd.get_dummies(df[["Connectivity", "Update", "Alerts", "Security"]])
-mlb = MultiLabelBinarizer()
-y = mlb.fit_transform(df["Recommendations"])
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-rec_model = RandomForestClassifier(n_estimators=100, random_state=42)
-rec_model.fit(X_train, y_train)
-
-# Ranking Model (LambdaMART)
-site_df = df.groupby("SiteName").agg({
-    "ConnectivityScore": "mean",
-    "UpdateScore": "mean",
-    "AlertScore": "mean",
-    "SecurityScore": "mean",
-    "ResourceType": lambda x: list(x)
-}).reset_index()
-site_df["SiteHealthScore"] = site_df[["ConnectivityScore","UpdateScore","AlertScore","SecurityScore"]].mean(axis=1)
-site_df["RankLabel"] = site_df["SiteHealthScore"].apply(map_health_to_label)
-all_types = sorted(set([rtype for sublist in site_df["ResourceType"] for rtype in sublist]))
-for t in all_types:
-    site_df[f"Type_{t}"] = site_df["ResourceType"].apply(lambda x: 1 if t in x else 0)
-
-feature_cols = ["ConnectivityScore","UpdateScore","AlertScore","SecurityScore"] + [f"Type_{t}" for t in all_types]
-X_rank = site_df[feature_cols]
-y_rank = site_df["RankLabel"]
-group = [len(site_df)]
-lgb_train = lgb.Dataset(X_rank, y_rank, group=group)
-
-params = {"objective": "lambdarank","metric": "ndcg","learning_rate": 0.1,"num_leaves": 31,"min_data_in_leaf": 1}
-ranker = lgb.train(params, lgb_train, num_boost_round=50)
+class StageRunner:
+    """Runs pipeline stages, caching the outputs of cacheable ones and timing all of them.
 
-# -----------------------------
-# Save models
-# -----------------------------
-joblib.dump(rec_model, "rec_model.pkl")
-joblib.dump(mlb, "mlb.pkl")
-joblib.dump(X.columns, "rec_features.pkl")
-joblib.dump(ranker, "ranker.pkl")
-joblib.dump(feature_cols, "rank_features.pkl")
+    A cached stage's output is stored under `cache_dir` keyed by a hash of the input
+    version, the stage name and its parameters, and reused when the key matches.
+    The report lists wall-clock time and memory per stage: the process's peak RSS so far,
+    or with `trace_memory` the stage's own peak traced (Python and NumPy) allocations,
+    which is more precise but slows the stages down severalfold.
+    """
+
+    def __init__(self, cache_dir=None, trace_memory=False):
+        self.cache_dir = cache_dir
+        self.trace_memory = trace_memory
+        self.report = []
+
+    def peak_mb(self):
+        if self.trace_memory:
+            return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        if resource is None:
+            return None
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+    def cache_path(self, name, key):
+        digest = hashlib.sha256(json.dumps([CACHE_VERSION, name, key], sort_keys=True).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{name}-{digest}.joblib")
+
+    def cached(self, name, cache_key):
+        return bool(self.cache_dir) and os.path.exists(self.cache_path(name, cache_key))
+
+    def run(self, name, fn, cache_key=None):
+        path = self.cache_path(name, cache_key) if self.cache_dir and cache_key is not None else None
+        start = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        if path and os.path.exists(path):
+            result, status = joblib.load(path), "cached"
+        else:
+            result, status = fn(), "ran"
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                joblib.dump(result, f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+        self.report.append({
+            "stage": name,
+            "status": status,
+            "seconds": round(time.perf_counter() - start, 3),
+            "peak_mb": self.peak_mb(),
+        })
+        return result
+
+    def print_report(self):
+        print(f"{'stage':<16}{'':8}{'time':>10}{'peak mem' if self.trace_memory else 'max RSS':>12}")
+        for row in self.report:
+            memory = f"{row['peak_mb']:>9.1f} MB" if row["peak_mb"] is not None else ""
+            print(f"{row['stage']:<16}{row['status']:8}{row['seconds']:>9.2f}s{memory}")
+        print(f"{'total':<24}{sum(row['seconds'] for row in self.report):>9.2f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the recommendation and ranking models into a model bundle")
+    parser.add_argument("--data", default="data/sites_clean.json", help="sites JSON, used when there is no table")
+    parser.add_argument("--table", default="data/sites_table", help="columnar resource table (preferred input)")
+    parser.add_argument("--bundle", default="model_bundle", help="model bundle directory to write")
+    parser.add_argument("--cache-dir", default=".train_cache", help="cache of intermediate artifacts")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every stage")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the labels and both models")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="cores for training (-1 = all)")
+    parser.add_argument("--report", help="also write the stage report as JSON to this file")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report each stage's peak traced allocations (slow) instead of the process's max RSS")
+    parser.add_argument("--group-by", choices=["cohort", "none"], default="cohort",
+                        help="ranking query groups: resource type cohorts, or all sites as one cohort")
+    parser.add_argument("--max-group-size", type=int, default=500, help="split larger groups (0 = never)")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of sites (whole groups) held out for NDCG")
+    parser.add_argument("--no-compile", action="store_true", help="don't add compiled NumPy predictors to the bundle")
+    parser.add_argument("--ndcg-at", type=int, default=10, help="K of the reported held-out NDCG@K")
+    parser.add_argument("--rule-labels", choices=["seeded", "deterministic"], default="seeded",
+                        help="rule-based training labels: random actions drawn with --seed, or the deterministic "
+                             "per status combination actions the API falls back to")
+    args = parser.parse_args(argv)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    runner = StageRunner(None if args.no_cache else args.cache_dir, trace_memory=args.trace_memory)
+    version = input_version(args.data, args.table)
+    rec_key = [version, args.seed, args.rule_labels]
+    rank_key = [version, args.seed, args.group_by, args.max_group_size, args.holdout]
+
+    # The telemetry is only loaded when a dataset stage actually has to run
+    table = None
+    if not (runner.cached("rec_features", rec_key) and runner.cached("rank_features", rank_key)):
+        table = runner.run("load", lambda: load_telemetry(args.data, args.table))
+    rec_dataset = runner.run("rec_features", lambda: build_rec_dataset(table, args.seed, args.rule_labels), cache_key=rec_key)
+    rank_dataset = runner.run("rank_features", lambda: build_rank_dataset(
+        table, args.group_by, args.max_group_size, args.holdout, args.seed
+    ), cache_key=rank_key)
+    rec_model = runner.run("train_rec_model", lambda: train_rec_model(rec_dataset, args.seed, args.n_jobs))
+    ranker, ndcg = runner.run("train_ranker", lambda: train_ranker(rank_dataset, args.seed, args.n_jobs, args.ndcg_at))
+    ranking = {
+        "group_by": args.group_by,
+        "max_group_size": args.max_group_size,
+        "cohorts": rank_dataset["cohorts"],
+        "train_groups": len(rank_dataset["train"]["group"]),
+        "holdout_groups": len(rank_dataset["valid"]["group"]),
+        f"holdout_ndcg@{args.ndcg_at}": None if ndcg is None else round(ndcg, 4),
+    }
+
+    # Model output for every status combination, served by app.py instead of the forest
+    rec_features = list(rec_dataset["X"].columns)
+    status_values = {col: list(score_map) for col, score_map in score_maps.items()}
+    rec_table = runner.run(
+        "rec_table", lambda: build_recommendation_table(rec_model, rec_dataset["mlb"], rec_features, status_values)
+    )
+
+    compiled = {} if args.no_compile else runner.run(
+        "compile", lambda: compile_models(rec_model, ranker, rec_dataset, rank_dataset)
+    )
+
+    bundle_version = runner.run("save_bundle", lambda: save_bundle(
+        args.bundle, rec_model=rec_model, mlb=rec_dataset["mlb"], rec_features=rec_features,
+        ranker=ranker, rank_features=rank_dataset["feature_cols"], rec_table=rec_table,
+        metadata={"ranking": ranking}, compiled=compiled
+    ))
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    runner.print_report()
+    print("Ranking: " + ", ".join(f"{key} {value}" for key, value in ranking.items()))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"input": version, "bundle": bundle_version, "ranking": ranking, "stages": runner.report}, f, indent=2)
+    print(f"✅ Models trained and saved to {args.bundle}/ (version {bundle_version}).")
 
-print("✅ Models trained and saved.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import numpy as np
+
+# LightGBM's missing value handling per split (MissingType in LightGBM's tree.h)
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+K_ZERO_THRESHOLD = 1e-35
+
+# Rows traversed at once; bounds the (rows x trees) index arrays of the traversal
+PREDICT_CHUNK_ROWS = 16384
+
+class TreeArrays:
+    """Trees flattened into node arrays, traversed for all rows and all trees at once.
+
+    Every node has a feature, threshold, left and right child (global node indices).
+    Leaves have feature -1 and point to themselves, so after `max_depth` steps every
+    (row, tree) position has reached its leaf whatever the depth it sits at.
+    """
+
+    def __init__(self, feature, threshold, left, right, default_left, missing, roots, max_depth):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.missing = np.asarray(missing, dtype=np.int8)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        # Without zero-as-missing splits, rows without NaN only need the threshold comparison
+        self.plain = not (self.missing[self.feature >= 0] == MISSING_ZERO).any()
+
+    def arrays(self):
+        return {
+            "feature": self.feature, "threshold": self.threshold, "left": self.left, "right": self.right,
+            "default_left": self.default_left, "missing": self.missing, "roots": self.roots,
+            "max_depth": np.array(self.max_depth),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(**{name: arrays[name] for name in (
+            "feature", "threshold", "left", "right", "default_left", "missing", "roots"
+        )}, max_depth=int(arrays["max_depth"]))
+
+    def leaves(self, X):
+        """Leaf node index of every row in every tree, shape (rows, trees)"""
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        if self.plain and not np.isnan(X).any():
+            # No missing values to route: a plain threshold comparison per step
+            for _ in range(self.max_depth):
+                nodes = np.where(X[rows, self.feature[nodes]] <= self.threshold[nodes], self.left[nodes], self.right[nodes])
+            return nodes
+        for _ in range(self.max_depth):
+            feature = self.feature[nodes]
+            x = X[rows, feature]
+            missing = self.missing[nodes]
+            nan = np.isnan(x)
+            x = np.where(nan & (missing != MISSING_NAN), 0.0, x)
+            is_missing = ((missing == MISSING_ZERO) & (np.abs(x) <= K_ZERO_THRESHOLD)) | ((missing == MISSING_NAN) & nan)
+            go_left = np.where(is_missing, self.default_left[nodes], x <= self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+class CompiledRanker:
+    """NumPy stand-in for a LightGBM Booster's `predict` (raw scores, numerical splits only)"""
+
+    def __init__(self, trees, leaf_value, feature_names):
+        self.trees = trees
+        self.leaf_value = np.asarray(leaf_value, dtype=np.float64)
+        self.feature_names = [str(name) for name in feature_names]
+
+    @classmethod
+    def from_booster(cls, booster):
+        """Flatten `booster.dump_model()`; raises ValueError for models it can't reproduce"""
+        model = booster.dump_model()
+        if model["num_tree_per_iteration"] != 1 or model.get("average_output"):
+            raise ValueError("Only single-output, non-averaged LightGBM models can be compiled")
+        nodes = {name: [] for name in ("feature", "threshold", "left", "right", "default_left", "missing", "value")}
+        roots, max_depth = [], 0
+
+        def add(node, depth):
+            nonlocal max_depth
+            i = len(nodes["feature"])
+            for values in nodes.values():
+                values.append(0)
+            if "leaf_value" in node:
+                nodes["feature"][i], nodes["left"][i], nodes["right"][i] = -1, i, i
+                nodes["value"][i] = node["leaf_value"]
+                max_depth = max(max_depth, depth)
+                return i
+            if node["decision_type"] != "<=":
+                raise ValueError(f"Unsupported split {node['decision_type']!r} (categorical features)")
+            nodes["feature"][i] = node["split_feature"]
+            nodes["threshold"][i] = node["threshold"]
+            nodes["default_left"][i] = node["default_left"]
+            nodes["missing"][i] = MISSING_TYPES[node["missing_type"]]
+            nodes["left"][i] = add(node["left_child"], depth + 1)
+            nodes["right"][i] = add(node["right_child"], depth + 1)
+            return i
+
+        for tree in model["tree_info"]:
+            roots.append(add(tree["tree_structure"], 0))
+        trees = TreeArrays(
+            nodes["feature"], nodes["threshold"], nodes["left"], nodes["right"],
+            nodes["default_left"], nodes["missing"], roots, max_depth
+        )
+        return cls(trees, nodes["value"], model["feature_names"])
+
+    def feature_name(self):
+        return list(self.feature_names)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        scores = np.empty(len(X))
+        for start in range(0, len(X), PREDICT_CHUNK_ROWS):
+            chunk = X[start:start + PREDICT_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = self.leaf_value[self.trees.leaves(chunk)].sum(axis=1)
+        return scores
+
+class CompiledForest:
+    """NumPy stand-in for a fitted (multi-output) RandomForestClassifier's `predict`"""
+
+    def __init__(self, trees, proba, classes, n_features_in):
+        self.trees = trees
+        self.proba = np.asarray(proba, dtype=np.float64)       # (nodes, outputs, max classes)
+        self.classes = np.asarray(classes, dtype=np.float64)   # (outputs, max classes)
+        self.n_features_in_ = int(n_features_in)
+        self.n_outputs_ = self.proba.shape[1]
+
+    @classmethod
+    def from_forest(cls, forest):
+        classes_list = forest.classes_ if forest.n_outputs_ > 1 else [forest.classes_]
+        max_classes = max(len(c) for c in classes_list)
+        classes = np.zeros((forest.n_outputs_, max_classes))
+        for k, c in enumerate(classes_list):
+            classes[k, :len(c)] = c
+
+        nodes = {name: [] for name in ("feature", "threshold", "left", "right", "default_left", "missing", "proba")}
+        roots, max_depth, offset = [], 0, 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            ids = np.arange(tree.node_count) + offset
+            nodes["feature"].append(np.where(leaf, -1, tree.feature))
+            nodes["threshold"].append(tree.threshold)
+            nodes["left"].append(np.where(leaf, ids, tree.children_left + offset))
+            nodes["right"].append(np.where(leaf, ids, tree.children_right + offset))
+            # sklearn sends NaN to the side recorded at fit time (right when it saw none)
+            nodes["default_left"].append(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=bool)))
+            nodes["missing"].append(np.full(tree.node_count, MISSING_NAN))
+            # Per-output class probabilities, normalized like DecisionTreeClassifier.predict_proba
+            proba = np.zeros((tree.node_count, forest.n_outputs_, max_classes))
+            for k, c in enumerate(classes_list):
+                values = tree.value[:, k, :len(c)]
+                normalizer = values.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                proba[:, k, :len(c)] = values / normalizer
+            nodes["proba"].append(proba)
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+
+        trees = TreeArrays(
+            *(np.concatenate(nodes[name]) for name in ("feature", "threshold", "left", "right", "default_left", "missing")),
+            roots, max_depth
+        )
+        return cls(trees, np.concatenate(nodes["proba"]), classes, forest.n_features_in_)
+
+    def predict(self, X):
+        # sklearn compares float32 feature values against its float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        predictions = np.empty((len(X), self.n_outputs_))
+        for start in range(0, len(X), PREDICT_CHUNK_ROWS):
+            leaves = self.trees.leaves(X[start:start + PREDICT_CHUNK_ROWS])
+            proba = np.zeros((len(leaves), self.n_outputs_, self.classes.shape[1]))
+            for t in range(leaves.shape[1]):
+                proba += self.proba[leaves[:, t]]
+            best = proba.argmax(axis=2)
+            predictions[start:start + len(leaves)] = np.take_along_axis(self.classes[None], best[..., None], axis=2)[..., 0]
+        return predictions
+
+# -----------------------------
+# Saving and loading
+# -----------------------------
+def save_compiled(path, model):
+    """Write a CompiledRanker or CompiledForest to an .npz file"""
+    arrays = {f"trees_{name}": values for name, values in model.trees.arrays().items()}
+    if isinstance(model, CompiledRanker):
+        arrays.update(kind=np.array("ranker"), leaf_value=model.leaf_value, feature_names=np.array(model.feature_names))
+    else:
+        arrays.update(kind=np.array("forest"), proba=model.proba, classes=model.classes,
+                      n_features_in=np.array(model.n_features_in_))
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+def load_compiled(path):
+    with np.load(path) as data:
+        trees = TreeArrays.from_arrays({name[len("trees_"):]: data[name] for name in data.files if name.startswith("trees_")})
+        if str(data["kind"]) == "ranker":
+            return CompiledRanker(trees, data["leaf_value"], data["feature_names"].tolist())
+        return CompiledForest(trees, data["proba"], data["classes"], int(data["n_features_in"]))
+
+def check_parity(original, compiled, X, atol=1e-9):
+    """Largest absolute difference between the original and compiled model's predictions on X.
+    Raises ValueError when it exceeds `atol`."""
+    expected = np.asarray(original.predict(X), dtype=np.float64)
+    actual = compiled.predict(X)
+    diff = float(np.max(np.abs(expected - actual))) if expected.size else 0.0
+    if diff > atol:
+        raise ValueError(f"Compiled {type(compiled).__name__} differs from the original model by {diff:g}")
+    return diff
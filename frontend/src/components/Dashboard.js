@@ -1,20 +1,32 @@
-import { useEffect, useState } from "react";
+import { useCallback, useEffect, useState } from "react";
 import "./Dashboard.css";
 import SiteRow from "./SiteRow";
 
+const PAGE_SIZE = 50;
+
 const Dashboard = () => {
   const [sites, setSites] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [loading, setLoading] = useState(false);
 
-  useEffect(() => {
-    fetch("/ranked_sites.json", { cache: "no-store" }) // served from public folder
+  // Pages of the ranking, most urgent sites first, proxied to the backend
+  const loadPage = useCallback((offset) => {
+    setLoading(true);
+    fetch(`/sites?limit=${PAGE_SIZE}&offset=${offset}`, { cache: "no-store" })
       .then((res) => res.json())
       .then((data) => {
         console.log("Fetched sites:", data);
-        setSites(data);
+        setSites((prev) => (offset === 0 ? data.items : [...prev, ...data.items]));
+        setTotal(data.total);
       })
-      .catch((err) => console.error("Error loading JSON:", err));
+      .catch((err) => console.error("Error loading JSON:", err))
+      .finally(() => setLoading(false));
   }, []);
 
+  useEffect(() => {
+    loadPage(0);
+  }, [loadPage]);
+
   return (
     <div className="dashboard">
       <h1 className="dashboard-title">Site AI Dashboard</h1>
@@ -34,6 +46,17 @@ const Dashboard = () => {
             <SiteRow key={i} site={site} />
           ))}
         </div>
+
+        <div className="table-footer">
+          <span>
+            Showing {sites.length} of {total} sites
+          </span>
+          {sites.length < total && (
+            <button className="analyze-btn" disabled={loading} onClick={() => loadPage(sites.length)}>
+              {loading ? "Loading…" : "Load more"}
+            </button>
+          )}
+        </div>
       </div>
     </div>
   );
@@ -13,10 +13,11 @@ const getStatusClass = (status) => {
 const SiteRow = ({ site }) => {
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [showRecs, setShowRecs] = useState(false);
+  const [recommendations, setRecommendations] = useState(site.Recommendations);
 
   // Flatten recommendations
-  const recsArr = site.Recommendations
-    ? Object.values(site.Recommendations).flat()
+  const recsArr = recommendations
+    ? Object.values(recommendations).flat()
     : [];
 
   // Format health score
@@ -28,10 +29,15 @@ const SiteRow = ({ site }) => {
   const handleAnalyze = () => {
     setIsAnalyzing(true);
     setShowRecs(false);
-    setTimeout(() => {
-      setIsAnalyzing(false);
-      setShowRecs(true);
-    }, 2000); // 2s fake delay
+    // Recommendations are computed on demand by the site detail endpoint
+    fetch(`/sites/${encodeURIComponent(site.SiteName)}`)
+      .then((res) => res.json())
+      .then((data) => setRecommendations(data.Recommendations))
+      .catch((err) => console.error("Error loading recommendations:", err))
+      .finally(() => {
+        setIsAnalyzing(false);
+        setShowRecs(true);
+      });
   };
 
   return (